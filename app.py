@@ -1,32 +1,54 @@
 import sys
 import os
 import json
+import time
+import argparse
 import subprocess
-import sqlite3
-from typing import List
-from rapidfuzz import fuzz
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, List, Optional, Tuple, Union
+
+startup_time = time.perf_counter()  # Start of the startup phases reported by --profile-startup
 from PyQt5.QtWidgets import (
     QApplication,
     QMainWindow,
     QVBoxLayout,
-    QHBoxLayout,
     QLineEdit,
-    QListWidget,
-    QListWidgetItem,
+    QListView,
     QWidget,
     QLabel,
-    QPushButton,
-    QSpacerItem,
     QSizePolicy
 )
-from PyQt5.QtCore import Qt, QTimer, QRect, QSize
-from PyQt5.QtGui import QGuiApplication, QIcon, QPixmap, QFont
+from PyQt5.QtCore import (
+    Qt,
+    QTimer,
+    QPoint,
+    QRect,
+    QRectF,
+    QSize,
+    QObject,
+    QRunnable,
+    QThreadPool,
+    QAbstractListModel,
+    QModelIndex,
+    pyqtSignal
+)
+from PyQt5.QtGui import QGuiApplication, QColor, QIcon, QImage, QPainter, QPalette, QPen, QPixmap, QFont
+from search_client import SearchClient, SOCKET_PATH
+import library
+import thumbnails
+import timing
+
+# Loaded once the window is shown, see warm_up() in main()
+if TYPE_CHECKING:
+    from search_engine import SearchEngine
+    from pdf_cache import PdfCache
 
 # Set the working directory to the directory of this script
 script_directory = os.path.dirname(os.path.abspath(__file__))
 os.chdir(script_directory)
 
-DB_FILE = "file_index.db"  # SQLite database file created by indexer.py
+THUMBNAIL_MEMORY_CACHE = 500  # Thumbnails kept loaded in memory
+STATS_REFRESH_MS = 500  # Interval between refreshes of the visible stats overlay
 
 def resource_path(relative_path: str) -> str:
     """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -41,194 +63,429 @@ def load_cfg() -> dict:
     with open(resource_path('config.json')) as f:
         return json.load(f)
 
-def connect_db(db_file: str) -> sqlite3.Connection:
-    """ Connect to the SQLite database """
-    return sqlite3.connect(db_file)
-
-import unicodedata
-
-def normalize_text(text: str) -> str:
-    """ Normalize text by removing accents and converting to lowercase. """
-    return ''.join(
-        c for c in unicodedata.normalize('NFD', text.lower()) if unicodedata.category(c) != 'Mn'
-    )
-
-def search_pdfs(query: str, db_conn: sqlite3.Connection, limit: int = 20) -> List[str]:
-    """ Search for PDFs with normalized text for better matching with special characters. """
-    cursor = db_conn.cursor()
-    tokens = query.lower().split()
-
-    # Prepare the SQL query to match each token, with normalization for accents
-    sql_query = "SELECT path FROM file_index WHERE " + " AND ".join(["lower(name) LIKE ?" for _ in tokens])
-    sql_params = tuple(f"%{token}%" for token in tokens)
-
-    cursor.execute(f"{sql_query} LIMIT ?", (*sql_params, limit))
-    return [row[0] for row in cursor.fetchall()]
-
-def fuzzy_token_match(query_tokens: List[str], filename: str) -> int:
-    """ Perform fuzzy matching on each token with normalized filenames. """
-    filename_lower = normalize_text(filename)
-    total_score = 0
-    for token in query_tokens:
-        token_score = fuzz.partial_ratio(token, filename_lower)
-        total_score += token_score
-    return total_score // len(query_tokens)  # Average score
-
-
+class ThumbnailSignals(QObject):
+    """ Signals emitted by a ThumbnailTask back to the GUI thread """
+    loaded = pyqtSignal(str, object)  # PDF path, QImage or None
+
+
+class ThumbnailTask(QRunnable):
+    """ Loads, or renders on a cache miss, the first-page thumbnail of a PDF off the GUI thread. """
+
+    def __init__(self, pdf: str, signals: ThumbnailSignals) -> None:
+        super().__init__()
+        self.pdf = pdf
+        self.signals = signals
+
+    def run(self) -> None:
+        path = thumbnails.get_thumbnail(self.pdf)
+        image = QImage(path) if path else None
+        self.signals.loaded.emit(self.pdf, image if image and not image.isNull() else None)
+
+
+class ResultListModel(QAbstractListModel):
+    """ Search results for the list view, as (path, score) rows.
+
+    The view asks for the data of visible rows only, all rows share one icon, and new
+    results are applied as removed and inserted row ranges around the rows that stay the
+    same, so thousands of results cost no more than the rows on screen.
+
+    With thumbnails enabled, a visible row without a thumbnail yet shows the shared icon and
+    queues its thumbnail on a background pool; the row is repainted once it has loaded.
+    """
+
+    def __init__(self, icon_path: str, show_thumbnails: bool = False) -> None:
+        super().__init__()
+        self.icon = QIcon(icon_path)  # Loaded once and shared by every row
+        self.rows: List[Tuple[str, int]] = []
+
+        self.show_thumbnails = show_thumbnails
+        self.thumbnails: "OrderedDict[str, QIcon]" = OrderedDict()  # Recently shown, by PDF path
+        self.requested = set()  # PDF paths with a thumbnail task queued or running
+        self.thumbnail_pool = QThreadPool(self)
+        self.thumbnail_pool.setMaxThreadCount(2)
+        self.thumbnail_signals = ThumbnailSignals()
+        self.thumbnail_signals.loaded.connect(self.on_thumbnail_loaded)
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        pdf = self.rows[index.row()][0]
+        if role == Qt.DisplayRole:
+            return os.path.basename(pdf)
+        if role == Qt.DecorationRole:
+            return self.thumbnail(pdf) if self.show_thumbnails else self.icon
+        if role == Qt.UserRole:
+            return pdf
+        return None
+
+    def thumbnail(self, pdf: str) -> QIcon:
+        """ Return the thumbnail of a PDF if it is loaded, else queue it and return the icon """
+        icon = self.thumbnails.get(pdf)
+        if icon is not None:
+            self.thumbnails.move_to_end(pdf)
+            return icon
+        if pdf not in self.requested:
+            self.requested.add(pdf)
+            self.thumbnail_pool.start(ThumbnailTask(pdf, self.thumbnail_signals))
+        return self.icon
+
+    def on_thumbnail_loaded(self, pdf: str, image: Optional[QImage]) -> None:
+        self.requested.discard(pdf)
+        # PDFs without a thumbnail keep the shared icon and are not retried while cached here
+        self.thumbnails[pdf] = QIcon(QPixmap.fromImage(image)) if image is not None else self.icon
+        if len(self.thumbnails) > THUMBNAIL_MEMORY_CACHE:
+            self.thumbnails.popitem(last=False)
+        for row, (row_pdf, _) in enumerate(self.rows):
+            if row_pdf == pdf:
+                index = self.index(row)
+                self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+    def set_results(self, matches: List[Tuple[str, int]]) -> None:
+        """ Replace the rows, only touching the range that differs from the current rows """
+        old = [pdf for pdf, _ in self.rows]
+        new = [pdf for pdf, _ in matches]
+
+        # Rows matching at the start and at the end of both lists stay in place
+        prefix = 0
+        while prefix < min(len(old), len(new)) and old[prefix] == new[prefix]:
+            prefix += 1
+        suffix = 0
+        while (suffix < min(len(old), len(new)) - prefix
+               and old[len(old) - 1 - suffix] == new[len(new) - 1 - suffix]):
+            suffix += 1
+
+        removed = len(old) - prefix - suffix
+        if removed:
+            self.beginRemoveRows(QModelIndex(), prefix, prefix + removed - 1)
+            del self.rows[prefix:prefix + removed]
+            self.endRemoveRows()
+
+        inserted = len(new) - prefix - suffix
+        if inserted:
+            self.beginInsertRows(QModelIndex(), prefix, prefix + inserted - 1)
+            self.rows[prefix:prefix] = matches[prefix:prefix + inserted]
+            self.endInsertRows()
+
+        self.rows = list(matches)  # Take over the new scores of the unchanged rows
+
+        # Thumbnails still waiting for a thread are for rows that may no longer be shown
+        self.thumbnail_pool.clear()
+        self.requested.clear()
+
+@timing.timed("update_list_view")
 def update_list_view(
-    search: QLineEdit,
-    list_view: QListWidget,
-    db_conn: sqlite3.Connection,
-    icon_path: str,
+    list_view: QListView,
+    model: ResultListModel,
+    matches: List[Tuple[str, int]],
 ) -> None:
-    """ Update the list view based on the search query using token-based fuzzy matching. """
-    query = search.text().lower()
-    list_view.clear()
-
-    if query.strip():
-        # Split the query into tokens for matching
-        query_tokens = query.split()
-
-        # Search the database for files matching the tokens
-        pdfs = search_pdfs(query, db_conn)
-
-        # Perform fuzzy matching on the results
-        matches = [(pdf, fuzzy_token_match(query_tokens, os.path.basename(pdf))) for pdf in pdfs]
-
-        # Sort by the fuzzy match score in descending order
-        matches = sorted(matches, key=lambda x: x[1], reverse=True)
-
-        # Add results with a score above a certain threshold to the list
-        for pdf, score in matches:
-            if score > 50:  # Adjust threshold as needed
-                item = QListWidgetItem(os.path.basename(pdf))
-                item.setIcon(QIcon(icon_path))  # Set the file icon
-                item.setData(Qt.UserRole, pdf)
-                list_view.addItem(item)
-
-        if list_view.count() > 0:
-            list_view.setCurrentRow(0)
-
-
-def open_pdf(item: QListWidgetItem, viewer: str) -> None:
-    """ Open the selected PDF with the specified viewer """
+    """ Show the (path, score) search results in the list view, best match first. """
+    model.set_results(matches)
+
+    if model.rowCount() > 0:
+        list_view.setCurrentIndex(model.index(0))
+
+
+class SearchSignals(QObject):
+    """ Signals emitted by a SearchTask or WarmUpTask back to the GUI thread """
+    finished = pyqtSignal(int, object)  # Query generation, list of (path, score)
+    warmed = pyqtSignal()  # The engine is loaded and ready for the first query
+
+
+class SearchTask(QRunnable):
+    """ Runs one query against the search engine on a worker thread. """
+
+    def __init__(self, worker: "SearchWorker", generation: int, query: str) -> None:
+        super().__init__()
+        self.worker = worker
+        self.generation = generation
+        self.query = query
+
+    def run(self) -> None:
+        # The user may have typed past this query while it waited in the pool
+        if self.generation != self.worker.generation:
+            return
+        matches = self.worker.get_engine().search(self.query, limit=self.worker.limit)
+        self.worker.signals.finished.emit(self.generation, matches)
+
+
+class WarmUpTask(QRunnable):
+    """ Creates and warms up the search engine on the worker thread, ahead of the first query. """
+
+    def __init__(self, worker: "SearchWorker") -> None:
+        super().__init__()
+        self.worker = worker
+
+    def run(self) -> None:
+        self.worker.get_engine().warm_up()
+        self.worker.signals.warmed.emit()
+
+
+class SearchWorker(QObject):
+    """ Runs searches off the GUI thread so typing never blocks on scoring.
+
+    Keystrokes are debounced and each query gets a generation number; results that
+    arrive for an older generation than the latest query are dropped unrendered.
+
+    The engine is made by make_engine on the worker thread, on warm_up() or the first
+    search, so neither loading it nor importing its dependencies delays the window.
+    """
+
+    results_ready = pyqtSignal(object)  # List of (path, score) for the latest query
+
+    def __init__(
+        self,
+        make_engine: Callable[[], Union["SearchEngine", SearchClient]],
+        debounce_ms: int,
+        limit: int = 20,
+    ) -> None:
+        super().__init__()
+        self.make_engine = make_engine
+        self.engine: Union["SearchEngine", SearchClient, None] = None
+        self.limit = limit
+        self.generation = 0
+        self.query = ""
+        self.typed_at = 0.0  # perf_counter() of the keystroke that made the latest query
+
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)  # The engine already scores on every core
+
+        self.signals = SearchSignals()
+        self.signals.finished.connect(self.on_finished)
+
+        self.debounce_timer = QTimer(self)
+        self.debounce_timer.setSingleShot(True)
+        self.debounce_timer.setInterval(debounce_ms)
+        self.debounce_timer.timeout.connect(self.start_search)
+
+    def get_engine(self) -> Union["SearchEngine", SearchClient]:
+        """ Return the engine, making it on first use; only called on the pool's one thread """
+        if self.engine is None:
+            self.engine = self.make_engine()
+        return self.engine
+
+    def warm_up(self) -> None:
+        """ Make and warm up the engine in the background """
+        self.pool.start(WarmUpTask(self))
+
+    def schedule(self, query: str) -> None:
+        """ Queue a search for the query once typing pauses for the debounce interval """
+        self.generation += 1
+        self.query = query
+        self.typed_at = time.perf_counter()
+        if not query.strip():
+            self.debounce_timer.stop()
+            self.results_ready.emit([])
+            return
+        self.debounce_timer.start()
+
+    def start_search(self) -> None:
+        self.pool.clear()  # Drop queued searches that have not started yet
+        self.pool.start(SearchTask(self, self.generation, self.query))
+
+    def on_finished(self, generation: int, matches: List[Tuple[str, int]]) -> None:
+        if generation == self.generation:
+            self.results_ready.emit(matches)
+            # Debounce, queueing, search and list update together, as the user experiences them
+            timing.record("keystroke_to_results", time.perf_counter() - self.typed_at)
+
+
+@timing.timed("open_pdf")
+def open_pdf(pdf_path: str, viewer: str, pdf_cache: Optional["PdfCache"] = None) -> None:
+    """ Open the selected PDF with the specified viewer, from its local copy if it has one """
+    if pdf_cache is not None:
+        pdf_path = pdf_cache.open_path(pdf_path)
     if viewer.lower() == "firefox":
-        subprocess.Popen([viewer, "--new-window", "--kiosk", item.data(Qt.UserRole)])
+        subprocess.Popen([viewer, "--new-window", "--kiosk", pdf_path])
     else:
-        subprocess.Popen([viewer, item.data(Qt.UserRole)])
-
-def handle_key_event(event: QGuiApplication, list_view: QListWidget, search: QLineEdit, viewer: str) -> None:
+        subprocess.Popen([viewer, pdf_path])
+
+class StatsOverlay(QLabel):
+    """ Timing stats of the recent searches and opens, drawn over the top of the window.
+
+    Toggled with F12. While shown, it is refreshed from the rolling timing windows on a
+    timer, so it costs nothing while hidden.
+    """
+
+    def __init__(self, parent: QWidget) -> None:
+        super().__init__(parent)
+        self.setFont(QFont("monospace", 9))
+        self.setStyleSheet("background-color: rgba(0, 0, 0, 200); color: #7CFC00; padding: 6px;")
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)  # Taps go through to the widgets below
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(STATS_REFRESH_MS)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.hide()
+
+    def refresh(self) -> None:
+        self.setText(timing.format_summary())
+        self.adjustSize()
+        self.raise_()
+
+    def toggle(self) -> None:
+        if self.isVisible():
+            self.refresh_timer.stop()
+            self.hide()
+        else:
+            self.refresh()
+            self.show()
+            self.refresh_timer.start()
+
+def handle_key_event(
+    event: QGuiApplication,
+    list_view: QListView,
+    search: QLineEdit,
+    viewer: str,
+    pdf_cache: Optional["PdfCache"] = None,
+) -> None:
     """ Handle key events for navigation and selection """
+    model = list_view.model()
     if event.key() in (Qt.Key_Up, Qt.Key_Down):
-        if list_view.count() > 0:
-            current_row = list_view.currentRow()
+        if model.rowCount() > 0:
+            current_row = list_view.currentIndex().row()
             if event.key() == Qt.Key_Up:
-                list_view.setCurrentRow(max(current_row - 1, 0))
+                list_view.setCurrentIndex(model.index(max(current_row - 1, 0)))
             elif event.key() == Qt.Key_Down:
-                list_view.setCurrentRow(min(current_row + 1, list_view.count() - 1))
+                list_view.setCurrentIndex(model.index(min(current_row + 1, model.rowCount() - 1)))
     elif event.key() == Qt.Key_Return:
-        current_item = list_view.currentItem()
-        if current_item:
-            open_pdf(current_item, viewer)
-
-def add_keyboard(layout: QVBoxLayout, target_input: QLineEdit) -> None:
-    """Add centered on-screen keyboard with offset rows to mimic real keyboard layout."""
-    cfg = load_cfg()
-    osk_cfg = cfg["gui"]["osk"]
-
-    button_size = osk_cfg["button_size"]
-    space_button_size = osk_cfg["space_button_size"]
-    backspace_button_size = osk_cfg["backspace_button_size"]
-    toggle_case_button_size = osk_cfg["toggle_case_button_size"]
-    delete_button_size = osk_cfg["delete_button_size"]
-    font_size = osk_cfg["font_size"]
-    button_spacing = osk_cfg["button_spacing"]
-    row_spacing = osk_cfg["row_spacing"]
-    rows = osk_cfg["rows"]
-
-    # Dynamically set row offsets based on the number of rows
-    row_offsets = [i * 20 for i in range(len(rows))]  # Adjust 20 as needed for spacing
-
-    is_uppercase = False
-    letter_buttons = {}
-    toggle_case_button = None  # Placeholder for the Toggle Case button
-
-    osk_widget = QWidget()
-    osk_layout = QVBoxLayout()
-    osk_layout.setSpacing(row_spacing)
-    osk_layout.setContentsMargins(0, 0, 0, 0)
-
-    osk_container_layout = QHBoxLayout()
-    osk_container_layout.addStretch()
-    osk_container_layout.addLayout(osk_layout)
-    osk_container_layout.addStretch()
-    osk_widget.setLayout(osk_container_layout)
-
-    def toggle_case():
-        nonlocal is_uppercase
-        is_uppercase = not is_uppercase
-        # Update the text/icon of the toggle case button
-        if toggle_case_button:
-            toggle_case_button.setText("󰬶" if is_uppercase else "󰬵")
-        # Update all letter buttons to the current case
-        for key, button in letter_buttons.items():
-            button.setText(key.upper() if is_uppercase else key.lower())
-
-    for i, row in enumerate(rows):
-        row_layout = QHBoxLayout()
-        row_layout.setSpacing(button_spacing)
-        row_layout.setContentsMargins(row_offsets[i], 0, 0, 0)  # Set offset for each row
-
-        row_layout.addSpacerItem(QSpacerItem(40, 20, QSizePolicy.Expanding, QSizePolicy.Minimum))
-
-        for key in row:
-            if key == "Space":
-                button = QPushButton(" ")
-                button.setFixedSize(space_button_size[0], space_button_size[1])
-                button.clicked.connect(lambda checked: on_key_press(" ", target_input))
-            elif key == "Backspace":
-                button = QPushButton("󰭜 ")
-                button.setFixedSize(backspace_button_size[0], backspace_button_size[1])
-                button.clicked.connect(lambda checked: on_backspace_press(target_input))
-            elif key == "Delete":
-                button = QPushButton("󰹿 ")
-                button.setFixedSize(delete_button_size[0], delete_button_size[1])
-                button.clicked.connect(lambda checked: on_delete_press(target_input))
-            elif key == "Toggle Case":
-                # Create the Toggle Case button with initial text
-                button = QPushButton( "󰬶" if is_uppercase else "󰬵")
-                button.setFixedSize(toggle_case_button_size[0], toggle_case_button_size[1])
-                button.clicked.connect(toggle_case)
-                toggle_case_button = button # Store reference to update text/icon later
-            elif key == "Left":
-                button = QPushButton("←")  # Left arrow symbol
-                button.setFixedSize(button_size[0], button_size[1])
-                button.clicked.connect(lambda checked: move_cursor_left(target_input))  # Move cursor left
-            elif key == "Right":
-                button = QPushButton("→")  # Right arrow symbol
-                button.setFixedSize(button_size[0], button_size[1])
-                button.clicked.connect(lambda checked: move_cursor_right(target_input))  # Move cursor right
-            elif key.isdigit():  # For number keys "0" - "9"
-                button = QPushButton(key)
-                button.setFixedSize(button_size[0], button_size[1])
-                button.clicked.connect(lambda checked, char=key: on_key_press(char, target_input))
+        current_index = list_view.currentIndex()
+        if current_index.isValid():
+            open_pdf(current_index.data(Qt.UserRole), viewer, pdf_cache)
+
+class OnScreenKeyboard(QWidget):
+    """ On-screen keyboard painted as a single widget from the osk config.
+
+    Keys are laid out once as rectangles, rows offset to mimic a real keyboard and the
+    whole grid centered, and a tap is hit-tested against them. Nothing is a child widget,
+    so there is no per-key stylesheet or layout, and toggling the case is one repaint.
+    """
+
+    ROW_OFFSET = 20  # Pixels each row is shifted right of the one above it
+
+    def __init__(self, osk_cfg: dict, target_input: QLineEdit) -> None:
+        super().__init__()
+        self.target_input = target_input
+        self.is_uppercase = False
+        self.pressed: Optional[int] = None  # Index of the key held down
+        self.setFocusPolicy(Qt.NoFocus)  # Keep the focus, and the cursor, in the search field
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+
+        self.key_font = QFont()
+        self.key_font.setPixelSize(osk_cfg["font_size"])
+
+        key_sizes = {
+            "Space": osk_cfg["space_button_size"],
+            "Backspace": osk_cfg["backspace_button_size"],
+            "Delete": osk_cfg["delete_button_size"],
+            "Toggle Case": osk_cfg["toggle_case_button_size"],
+        }
+        button_spacing = osk_cfg["button_spacing"]
+
+        # Key rectangles relative to the top left corner of the grid, which is centered on paint
+        rows = []
+        y = 0
+        for i, row in enumerate(osk_cfg["rows"]):
+            sizes = [key_sizes.get(key, osk_cfg["button_size"]) for key in row]
+            width = sum(w for w, _ in sizes) + button_spacing * (len(row) - 1)
+            rows.append((i * self.ROW_OFFSET, width, y, row, sizes))
+            y += max(h for _, h in sizes) + osk_cfg["row_spacing"]
+        self.grid_width = max(offset + width for offset, width, _, _, _ in rows)
+        self.grid_height = y - osk_cfg["row_spacing"]
+
+        self.keys: List[Tuple[QRect, str]] = []
+        for offset, width, y, row, sizes in rows:
+            # Each row is centered in what its offset leaves of the grid width
+            x = offset + (self.grid_width - offset - width) // 2
+            for key, (w, h) in zip(row, sizes):
+                self.keys.append((QRect(x, y, w, h), key))
+                x += w + button_spacing
+
+        self.setMinimumWidth(self.grid_width)
+        self.setFixedHeight(self.grid_height + 1)
+
+    def sizeHint(self) -> QSize:
+        return QSize(self.grid_width + 1, self.grid_height + 1)
+
+    def grid_origin(self) -> int:
+        return (self.width() - self.grid_width) // 2
+
+    def key_rect(self, index: int) -> QRect:
+        return self.keys[index][0].translated(self.grid_origin(), 0)
+
+    def label(self, key: str) -> str:
+        if key == "Space":
+            return " "
+        if key == "Backspace":
+            return "󰭜 "
+        if key == "Delete":
+            return "󰹿 "
+        if key == "Toggle Case":
+            return "󰬶" if self.is_uppercase else "󰬵"
+        if key == "Left":
+            return "←"
+        if key == "Right":
+            return "→"
+        return key.upper() if self.is_uppercase else key.lower()
+
+    def key_at(self, pos: QPoint) -> Optional[int]:
+        pos = pos - QPoint(self.grid_origin(), 0)
+        for index, (rect, _) in enumerate(self.keys):
+            if rect.contains(pos):
+                return index
+        return None
+
+    def paintEvent(self, event) -> None:
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setFont(self.key_font)
+        text_color = self.palette().color(QPalette.WindowText)
+        border = QPen(QColor("green"))
+        painter.translate(self.grid_origin(), 0)
+        for index, (rect, key) in enumerate(self.keys):
+            painter.setPen(border)
+            if index == self.pressed:
+                painter.setBrush(QColor(0, 128, 0, 128))
             else:
-                button = QPushButton(key.upper() if is_uppercase else key.lower())
-                button.setFixedSize(button_size[0], button_size[1])
-                button.clicked.connect(lambda checked, char=key: on_key_press(char.upper() if is_uppercase else char.lower(), target_input))
-                letter_buttons[key] = button
-
-            # button.setStyleSheet(f'font-size: {font_size}px;')
-            # row_layout.addWidget(button)
-
-            # Apply font size and debug border to each button
-            button.setStyleSheet(f'font-size: {font_size}px; border: 1px solid green; border-radius:4px; ')  # Border for each button
-            row_layout.addWidget(button)
-
-        row_layout.addSpacerItem(QSpacerItem(40, 20, QSizePolicy.Expanding, QSizePolicy.Minimum))
-        osk_layout.addLayout(row_layout)
-
-    layout.addWidget(osk_widget)
+                painter.setBrush(Qt.NoBrush)
+            painter.drawRoundedRect(QRectF(rect).adjusted(0.5, 0.5, -0.5, -0.5), 4, 4)
+            painter.setPen(text_color)
+            painter.drawText(rect, Qt.AlignCenter, self.label(key))
+
+    def mousePressEvent(self, event) -> None:
+        self.pressed = self.key_at(event.pos())
+        if self.pressed is not None:
+            self.update(self.key_rect(self.pressed))
+
+    def mouseReleaseEvent(self, event) -> None:
+        pressed, self.pressed = self.pressed, None
+        if pressed is None:
+            return
+        self.update(self.key_rect(pressed))
+        if self.key_at(event.pos()) == pressed:  # Sliding off a key cancels it
+            self.activate(self.keys[pressed][1])
+
+    def activate(self, key: str) -> None:
+        """ Apply a key to the search field """
+        if key == "Backspace":
+            on_backspace_press(self.target_input)
+        elif key == "Delete":
+            on_delete_press(self.target_input)
+        elif key == "Toggle Case":
+            self.is_uppercase = not self.is_uppercase
+            self.update()  # Every letter changes, repaint the grid once
+        elif key == "Left":
+            move_cursor_left(self.target_input)
+        elif key == "Right":
+            move_cursor_right(self.target_input)
+        else:
+            on_key_press(self.label(key), self.target_input)
+
+def add_keyboard(layout: QVBoxLayout, target_input: QLineEdit, osk_cfg: dict) -> None:
+    """Add centered on-screen keyboard with offset rows to mimic real keyboard layout."""
+    layout.addWidget(OnScreenKeyboard(osk_cfg, target_input))
 
 # Helper functions for key actions remain the same
 def on_key_press(char: str, target_input: QLineEdit) -> None:
@@ -272,14 +529,46 @@ def move_cursor_right(target_input: QLineEdit) -> None:
         target_input.setCursorPosition(cursor_position + 1)
     target_input.setFocus()  # Ensure focus stays in input field
 
+class StartupProfile:
+    """ Durations of the startup phases, printed by --profile-startup once search is ready """
+
+    def __init__(self, enabled: bool) -> None:
+        self.enabled = enabled
+        self.phases: List[Tuple[str, float]] = []
+        self.last = startup_time
+
+    def mark(self, phase: str) -> None:
+        """ End the current phase under the given name """
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self) -> None:
+        if not self.enabled:
+            return
+        total = 0.0
+        print(f"{'phase':<16}{'ms':>9}{'total ms':>10}")
+        for phase, seconds in self.phases:
+            total += seconds
+            print(f"{phase:<16}{seconds * 1000:>9.1f}{total * 1000:>10.1f}")
+
 def main() -> None:
     """ Main function to run the PDF Search application """
+    parser = argparse.ArgumentParser(description="Search the sheet music library.")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print how long each startup phase took once search is ready")
+    args, qt_args = parser.parse_known_args()
+    profile = StartupProfile(args.profile_startup)
+    profile.mark("imports")
+
     cfg = load_cfg()
     viewer = cfg["pdf_viewer"]
     gui_cfg = cfg["gui"]
 
     icon_path = resource_path(gui_cfg["listview_icon_path"])  # Path to the list view icon
     logo_icon_path = resource_path(gui_cfg["logo_icon_path"])  # Path to the logo icon
+    icon_size = gui_cfg["thumbnail_size"] if gui_cfg["thumbnails"] else 24  # List icon size in pixels
+    row_height = max(30, icon_size + 6)
     logo_title_text = gui_cfg["logo_title_text"]
 
     background_color = gui_cfg["background_color"]
@@ -293,11 +582,13 @@ def main() -> None:
     title_font_size = gui_cfg["title_font_size"]
     padding = gui_cfg["padding"]
     spacing = gui_cfg["spacing"]
+    profile.mark("config")
 
-    app = QApplication(sys.argv)
+    app = QApplication(sys.argv[:1] + qt_args)
     app.setApplicationName("PDFSearchApp")
     app.setApplicationDisplayName("PDF Search Application")
     QGuiApplication.setDesktopFileName("pdfsearchapp.desktop")
+    profile.mark("qt_init")
 
     win = QMainWindow()
     win.setWindowTitle('PDF Search')
@@ -349,37 +640,50 @@ def main() -> None:
       """ # Center the placeholder text and remove border
     )
 
-    # Connect to the database
-    db_conn = connect_db(DB_FILE)
-    search.textChanged.connect(lambda: update_list_view(search, list_view, db_conn, icon_path))
+    # Query the resident search daemon, started if it is not running yet, or load every
+    # indexed file name of every root's shard into an in-process search engine. Either is
+    # made and queried off the GUI thread.
+    daemon_cfg = cfg["search_daemon"]
+    db_files = library.shard_files(library.parse_roots(cfg))
+    def make_engine() -> Union["SearchEngine", SearchClient]:
+        if daemon_cfg["enabled"]:
+            return SearchClient(daemon_cfg["socket"] or SOCKET_PATH, db_files, in_memory=cfg["search_in_memory"])
+        from search_engine import SearchEngine  # Deferred, it pulls in numpy and rapidfuzz
+        return SearchEngine(db_files, in_memory=cfg["search_in_memory"])
+
+    search_worker = SearchWorker(make_engine, gui_cfg["search_debounce_ms"], gui_cfg["max_results"])
+    search.textChanged.connect(search_worker.schedule)
     layout.addWidget(search)
 
+    pdf_cache = None  # Opened by warm_up() below, once the window is shown
+
     # Function to open PDF when a list item is double-tapped
-    def open_pdf_on_double_tap(item: QListWidgetItem) -> None:
+    def open_pdf_on_double_tap(index: QModelIndex) -> None:
         """ Open the selected PDF file when an item is double-tapped. """
-        pdf_path = item.data(Qt.UserRole)  # Assuming the path is stored in UserRole
-        viewer = cfg["pdf_viewer"]
-        subprocess.Popen([viewer, pdf_path])  # Open the PDF in the specified viewer
+        open_pdf(index.data(Qt.UserRole), viewer, pdf_cache)  # The path is stored in UserRole
 
-    list_view = QListWidget()
-    list_view.setIconSize(QSize(24, 24))
+    result_model = ResultListModel(icon_path, gui_cfg["thumbnails"])
+    list_view = QListView()
+    list_view.setModel(result_model)
+    list_view.setUniformItemSizes(True)  # Row heights are computed once, not per row
+    list_view.setIconSize(QSize(icon_size, icon_size))
     list_view.setStyleSheet(
       f"""
-      QListWidget {{
+      QListView {{
           background-color: {list_background_color};
           color: {list_text_color};
           font-size: {font_size}px;
           font-family: {font_family};
-          border: 1px solid white;  /* Explicit border on QListWidget */
+          border: 1px solid white;  /* Explicit border on QListView */
           border-radius: 4px;
           padding: 20px;
       }}
 
       /* Style individual items and set consistent row height */
-      QListWidget::item {{
+      QListView::item {{
           padding: 0px;  /* Padding within items */
-          min-height: 30px;  /* Set the minimum height for rows */
-          max-height: 30px;  /* Set the maximum height for rows */
+          min-height: {row_height}px;  /* Set the minimum height for rows */
+          max-height: {row_height}px;  /* Set the maximum height for rows */
       }}
 
       /* Vertical scrollbar styling */
@@ -413,30 +717,85 @@ def main() -> None:
     # Disable vertical and horizontal scroll bars
     # list_view.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
     # list_view.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
-    # Connect the itemDoubleClicked signal to open the PDF
-    list_view.itemDoubleClicked.connect(open_pdf_on_double_tap)
+    # Connect the doubleClicked signal to open the PDF
+    list_view.doubleClicked.connect(open_pdf_on_double_tap)
+
+    showing_results = False  # Set while new results move the highlight to the top hit
+
+    def show_results(matches: List[Tuple[str, int]]) -> None:
+        nonlocal showing_results
+        showing_results = True
+        try:
+            update_list_view(list_view, result_model, matches)
+        finally:
+            showing_results = False
+
+    # Copy the result the user highlights to local disk in the background, ready to be opened.
+    # The top hit highlighted by every new set of results is left alone, typing should not copy.
+    def prefetch_highlighted(current: QModelIndex, previous: QModelIndex) -> None:
+        if pdf_cache is not None and current.isValid() and not showing_results:
+            pdf_cache.prefetch(current.data(Qt.UserRole))
+
+    search_worker.results_ready.connect(show_results)
+    list_view.selectionModel().currentChanged.connect(prefetch_highlighted)
     list_view.setSpacing(2)
 
     list_view.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
     list_view.setHorizontalScrollBarPolicy(Qt.ScrollBarAsNeeded)
 
-    list_view.setVerticalScrollMode(QListWidget.ScrollPerPixel)
-    list_view.setHorizontalScrollMode(QListWidget.ScrollPerPixel)
+    list_view.setVerticalScrollMode(QListView.ScrollPerPixel)
+    list_view.setHorizontalScrollMode(QListView.ScrollPerPixel)
 
-    list_view.setVerticalScrollMode(QListWidget.ScrollPerPixel)
-    list_view.setHorizontalScrollMode(QListWidget.ScrollPerPixel)
+    list_view.setVerticalScrollMode(QListView.ScrollPerPixel)
+    list_view.setHorizontalScrollMode(QListView.ScrollPerPixel)
 
     layout.addWidget(list_view)
 
     # Add the on-screen keyboard
-    add_keyboard(layout, search)
+    add_keyboard(layout, search, gui_cfg["osk"])
 
 
     central.setLayout(layout)
+
+    # Timing stats overlay, and a periodic JSON-lines log of the same stats
+    stats_overlay = StatsOverlay(central)
+    if gui_cfg["stats_overlay"]:
+        stats_overlay.toggle()
+    timing_log = gui_cfg["timing_log"]
+    if timing_log:
+        timing_log_timer = QTimer(win)
+        timing_log_timer.timeout.connect(lambda: timing.dump(timing_log))
+        timing_log_timer.start(gui_cfg["timing_log_interval_s"] * 1000)
+        app.aboutToQuit.connect(lambda: timing.dump(timing_log))
+    profile.mark("build_window")
+
+    # Everything the first query or open needs but the first frame does not starts only once
+    # the window is up: the search engine or daemon connection, warmed on the search worker
+    # thread, and the local PDF cache
+    def warm_up() -> None:
+        nonlocal pdf_cache
+        profile.mark("show_window")
+        search_worker.warm_up()
+
+        # Keep local copies of frequently opened PDFs so they do not have to come from the NAS
+        cache_cfg = cfg["pdf_cache"]
+        if cache_cfg["enabled"]:
+            from pdf_cache import PdfCache
+            pdf_cache = PdfCache(cache_cfg["budget_mb"] * 1024 * 1024)
+
+    def on_warmed() -> None:
+        profile.mark("warm_search")
+        profile.report()
+
+    search_worker.signals.warmed.connect(on_warmed)
     win.show()
+    QTimer.singleShot(0, warm_up)  # Runs once the event loop has processed the show
 
     def keyPressEvent(event):
-        handle_key_event(event, list_view, search, viewer)
+        if event.key() == Qt.Key_F12:
+            stats_overlay.toggle()
+            return
+        handle_key_event(event, list_view, search, viewer, pdf_cache)
 
     win.keyPressEvent = keyPressEvent
 
@@ -0,0 +1,137 @@
+import os
+import sys
+import json
+import time
+import queue
+import sqlite3
+import argparse
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+import library
+import timing
+from search_engine import SearchEngine, rank_pdfs
+
+# Run many searches without the Qt window, for bulk catalogue checks (is every piece of a
+# concert programme in the library?) and for load-testing search throughput. Queries are
+# read one per line from a file or stdin and answered by a pool of worker processes, each
+# with its own connections to the shards, and every answer is written to stdout as one JSON
+# line, in input order, as soon as it and the ones before it are done:
+#
+#   {"line": 3, "query": "mozart son", "results": [["/path/to/Mozart - Sonata.pdf", 91], ...], "ms": 2.41}
+#
+# "engine" ranks like the app, through a SearchEngine holding the catalogue in memory;
+# "sql" ranks the PDFs found by search_pdfs() with fuzzy_token_match(), see rank_pdfs().
+# Blank lines are skipped. A summary of the throughput and latencies goes to stderr.
+IN_FLIGHT_PER_WORKER = 4  # Queries queued per worker process ahead of the output
+
+_engine: Optional[SearchEngine] = None  # Search state of a worker process, see init_worker()
+_db_conns: List[sqlite3.Connection] = []
+
+
+def init_worker(db_files: List[str], method: str, in_memory: bool) -> None:
+    """ Open the shards in a worker process, loading the catalogue for the engine method """
+    global _engine, _db_conns
+    if method == "engine":
+        _engine = SearchEngine(db_files, workers=1, in_memory=in_memory)  # Queries run in parallel instead
+    else:
+        _db_conns = [sqlite3.connect(db_file) for db_file in db_files]
+
+def run_query(query: str, limit: int) -> Tuple[List[Tuple[str, int]], float]:
+    """ Return the ranked matches of one query and the seconds it took """
+    start = time.perf_counter()
+    if _engine is not None:
+        matches = _engine.search(query, limit)
+    else:
+        matches = rank_pdfs(query, _db_conns, limit)
+    return matches, time.perf_counter() - start
+
+def read_queries(lines) -> Iterator[Tuple[int, str]]:
+    """ Yield the line number and text of every non-blank line """
+    for number, line in enumerate(lines, 1):
+        query = line.strip()
+        if query:
+            yield number, query
+
+def run_batch(queries: Iterator[Tuple[int, str]], db_files: List[str], method: str,
+              limit: int, workers: int, in_memory: bool) -> List[float]:
+    """ Answer the queries, writing one JSON line per query, and return their durations """
+    durations = []
+
+    def emit(number: int, query: str, matches: List[Tuple[str, int]], seconds: float) -> None:
+        durations.append(seconds)
+        line = {"line": number, "query": query, "results": matches, "ms": round(seconds * 1000, 3)}
+        sys.stdout.write(json.dumps(line) + "\n")
+        sys.stdout.flush()
+
+    if workers == 1:
+        init_worker(db_files, method, in_memory)
+        for number, query in queries:
+            emit(number, query, *run_query(query, limit))
+        return durations
+
+    # A reader thread submits the queries while this one writes the answers in the order they
+    # were read, so a stream on stdin is answered as it arrives. The bounded queue keeps a huge
+    # file from being submitted whole ahead of the output.
+    pending: "queue.Queue[Optional[Tuple[int, str, Future]]]" = queue.Queue(maxsize=workers * IN_FLIGHT_PER_WORKER)
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(db_files, method, in_memory)) as executor:
+        def submit_all() -> None:
+            try:
+                for number, query in queries:
+                    pending.put((number, query, executor.submit(run_query, query, limit)))
+            finally:
+                pending.put(None)  # Every query has been read
+
+        threading.Thread(target=submit_all, daemon=True).start()
+        while True:
+            item = pending.get()
+            if item is None:
+                break
+            number, query, future = item
+            emit(number, query, *future.result())
+    return durations
+
+
+# Main function to run a file of queries against the index
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Search the file index for every line of a query list, "
+                                                 "writing the results as JSON lines.")
+    parser.add_argument("queries", nargs="?", default="-", help="file with one query per line (default: stdin)")
+    parser.add_argument("--db", action="append",
+                        help="shard database to search, repeatable (default: the roots in config.json)")
+    parser.add_argument("--method", choices=("engine", "sql"), default="engine",
+                        help="rank like the app (engine) or through search_pdfs() (sql) (default: engine)")
+    parser.add_argument("--limit", type=int, default=20, help="results per query (default: 20)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="worker processes (default: number of CPUs)")
+    parser.add_argument("--in-memory", action="store_true", help="copy the index into memory in every worker")
+    args = parser.parse_args()
+
+    db_files = args.db or library.shard_files(library.load_roots())
+    for db_file in db_files:
+        if not os.path.exists(db_file):
+            print(f"Index database not found, skipping it: {db_file}", file=sys.stderr)
+    db_files = [db_file for db_file in db_files if os.path.exists(db_file)]
+    if not db_files:
+        sys.exit("No index database to search")
+
+    start = time.perf_counter()
+    if args.queries == "-":
+        durations = run_batch(read_queries(sys.stdin), db_files, args.method, args.limit,
+                              max(1, args.workers), args.in_memory)
+    else:
+        with open(args.queries) as f:
+            durations = run_batch(read_queries(f), db_files, args.method, args.limit,
+                                  max(1, args.workers), args.in_memory)
+    elapsed = time.perf_counter() - start
+
+    if durations:
+        stats = timing.percentiles(durations)
+        print(f"{len(durations)} queries in {elapsed:.2f} s ({len(durations) / elapsed:.1f} per second), "
+              f"p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms, p99 {stats['p99_ms']} ms",
+              file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import os
+import sys
+import io
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+from datetime import datetime
+
+import indexer
+import timing
+from search_engine import SearchEngine, rank_pdfs
+
+# Building blocks for realistic sheet music file names, accents included on purpose
+COMPOSERS = [
+    "Bach", "Beethoven", "Brahms", "Chopin", "Debussy", "Dvořák", "Fauré", "Franck",
+    "Grieg", "Händel", "Haydn", "Janáček", "Liszt", "Mendelssohn", "Mozart", "Mussorgsky",
+    "Poulenc", "Rachmaninoff", "Ravel", "Saint-Saëns", "Satie", "Schubert", "Schumann",
+    "Sibelius", "Smetana", "Tchaikovsky", "Telemann", "Vivaldi", "Nielsen", "Sæverud",
+]
+FORMS = [
+    "Sonata", "Nocturne", "Prélude", "Étude", "Fugue", "Mazurka", "Waltz", "Ballade",
+    "Impromptu", "Rhapsody", "Concerto", "Suite", "Partita", "Fantasie", "Lied", "Romance",
+    "Requiem", "Scherzo", "Variations", "Gymnopédie", "Berceuse", "Humoresque",
+]
+KEYS = [
+    "C major", "A minor", "E-flat major", "C-sharp minor", "G major", "D minor",
+    "F major", "B-flat minor", "E major", "F-sharp minor",
+]
+TITLES = ["Grønland", "Frühlingslied", "Clair de lune", "Für Elise", "Träumerei",
+          "Élégie", "Ständchen", "Pavane", "Barcarolle", "Ave Maria"]
+PARTS = ["Piano", "Violin", "Cello", "Flute", "Voice", "Score", "Choir", "Organ"]
+
+# Function to make up one sheet music file name
+def random_name(rng):
+    composer = rng.choice(COMPOSERS)
+    if rng.random() < 0.2:
+        title = rng.choice(TITLES)
+    else:
+        title = f"{rng.choice(FORMS)} in {rng.choice(KEYS)} Op. {rng.randint(1, 120)} No. {rng.randint(1, 12)}"
+    return f"{composer} - {title} ({rng.choice(PARTS)}).pdf"
+
+# Generate a synthetic library below root: composer folders, collection folders below them,
+# and files of realistic sizes. Files are sparse, so a large library takes little disk space.
+def generate_library(root, file_count, seed=0):
+    rng = random.Random(seed)
+    directories = []
+    for composer in COMPOSERS:
+        for collection in range(max(1, file_count // (len(COMPOSERS) * 200))):
+            directories.append(os.path.join(root, composer, f"Collection {collection + 1:03d}"))
+    for directory in directories:
+        os.makedirs(directory, exist_ok=True)
+
+    for i in range(file_count):
+        path = os.path.join(rng.choice(directories), f"{i:07d} {random_name(rng)}")
+        with open(path, "wb") as f:
+            f.truncate(rng.randint(100_000, 20_000_000))
+    return root
+
+# Function to make up typed query sequences: composers, titles and forms, sometimes with a typo
+def random_queries(count, seed=0):
+    rng = random.Random(seed + 1)
+    queries = []
+    for _ in range(count):
+        words = [rng.choice(COMPOSERS).lower(), rng.choice(FORMS + TITLES).lower()][:rng.randint(1, 2)]
+        query = " ".join(words)
+        if rng.random() < 0.3 and len(query) > 4:
+            i = rng.randrange(len(query) - 1)
+            query = query[:i] + query[i + 1] + query[i] + query[i + 2:]  # Swap two letters
+        queries.append(query)
+    return queries
+
+# Function to expand queries into every prefix a user types on the way to them
+def keystrokes(queries):
+    return [query[:i] for query in queries for i in range(1, len(query) + 1)]
+
+# Time a full index of the library into a fresh database, then a second, incremental run
+def bench_indexing(library, db_file, workers):
+    results = {}
+    conn = indexer.initialize_db(db_file)
+    for run in ("initial", "incremental"):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            files = indexer.index_files(library, conn, workers)
+        elapsed = time.perf_counter() - start
+        results[run] = {
+            "files": files,
+            "seconds": round(elapsed, 3),
+            "files_per_second": round(files / elapsed, 1),
+        }
+    conn.close()
+    return results
+
+# Replay every keystroke of the queries through the SQL prefilter plus fuzzy ranking, and
+# through the in-memory search engine the app uses
+def bench_search(db_file, queries, limit):
+    conn = indexer.initialize_db(db_file)
+    sql_latencies = []
+    for query in keystrokes(queries):
+        start = time.perf_counter()
+        rank_pdfs(query, [conn], limit)
+        sql_latencies.append(time.perf_counter() - start)
+    conn.close()
+
+    start = time.perf_counter()
+    engine = SearchEngine([db_file])
+    load_seconds = time.perf_counter() - start
+    engine_latencies = []
+    for query in keystrokes(queries):
+        start = time.perf_counter()
+        engine.search(query, limit)
+        engine_latencies.append(time.perf_counter() - start)
+
+    return {
+        "search_pdfs_fuzzy": timing.percentiles(sql_latencies),
+        "search_engine": dict(timing.percentiles(engine_latencies), load_seconds=round(load_seconds, 3)),
+    }
+
+# Main function to run the benchmark and write the results as JSON
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark indexing and search on a synthetic library.")
+    parser.add_argument("--files", type=int, default=10_000, help="number of files to generate (default: 10000)")
+    parser.add_argument("--library", help="existing library to index instead of generating one")
+    parser.add_argument("--workers", type=int, default=indexer.DEFAULT_WORKERS,
+                        help=f"indexer scan threads (default: {indexer.DEFAULT_WORKERS})")
+    parser.add_argument("--queries", type=int, default=50, help="number of typed queries to replay (default: 50)")
+    parser.add_argument("--limit", type=int, default=20, help="results per search (default: 20)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the generated names and queries")
+    parser.add_argument("--output", help="write the results to this JSON file as well as stdout")
+    parser.add_argument("--keep", action="store_true", help="keep the generated library and database")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="search-scores-bench-")
+    try:
+        library = args.library
+        generate_seconds = None
+        if library is None:
+            print(f"Generating {args.files} files in {work_dir}", file=sys.stderr)
+            start = time.perf_counter()
+            library = generate_library(os.path.join(work_dir, "library"), args.files, args.seed)
+            generate_seconds = round(time.perf_counter() - start, 3)
+
+        db_file = os.path.join(work_dir, "file_index.db")
+        print("Benchmarking indexing", file=sys.stderr)
+        indexing = bench_indexing(library, db_file, args.workers)
+        print("Benchmarking search", file=sys.stderr)
+        search = bench_search(db_file, random_queries(args.queries, args.seed), args.limit)
+
+        results = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "library": {"path": library, "generated_seconds": generate_seconds},
+            "workers": args.workers,
+            "indexing": indexing,
+            "db_size_bytes": os.path.getsize(db_file),
+            "search": search,
+        }
+        output = json.dumps(results, indent=2)
+        print(output)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(output + "\n")
+    finally:
+        if args.keep:
+            print(f"Kept {work_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
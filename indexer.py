@@ -1,97 +1,863 @@
 import os
+import sys
+import time
 import sqlite3
+import argparse
+import ctypes
+import ctypes.util
+import errno
+import queue
+import select
+import shutil
+import struct
+import subprocess
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
+import library
+import thumbnails
+from library import normalize_text, name_tokens, token_variants
 
-# Specify the directory to index and the SQLite database file
-BASE_DIR = os.path.expanduser('~/nas/vol1/mus/smc/')
+# Number of rows written per executemany call
+BATCH_SIZE = 1000
+# Minimum number of seconds between two progress updates in the terminal
+PROGRESS_INTERVAL = 0.5
+# Number of threads scanning directories concurrently, 1 walks the tree serially
+DEFAULT_WORKERS = 8
+# Maximum number of scanned directories waiting for the database writer
+QUEUE_SIZE = 64
+# Content extraction: pages of text read per PDF, characters kept, seconds allowed per tool run
+EXTRACT_PAGES = 2
+EXTRACT_MAX_CHARS = 4000
+EXTRACT_TIMEOUT = 30
+# Watch mode: seconds without new events that end a burst, and the longest a burst is held back
+COALESCE_DELAY = 1.0
+MAX_COALESCE_DELAY = 10.0
+# Watch mode: default number of seconds between two directory mtime sweeps
+DEFAULT_SWEEP_INTERVAL = 300
+# Seconds a sync waits for another indexer's sync of the same database to finish
+LOCK_TIMEOUT = 3600
 
-# Set the working directory to the directory of this script
-script_directory = os.path.dirname(os.path.abspath(__file__))
-os.chdir(script_directory)
+# inotify event flags from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+INOTIFY_EVENT_SIZE = struct.calcsize('iIII')
 
-DB_FILE = "file_index.db"
+# Function to apply changes in the number of files containing each token to the token
+# dictionary, adding the deletion variants of new tokens and dropping those of vanished ones
+def update_token_index(cursor, deltas):
+    added = []
+    removed = []
+    for token, delta in deltas.items():
+        if delta == 0:
+            continue
+        row = cursor.execute('SELECT files FROM name_tokens WHERE token = ?', (token,)).fetchone()
+        files = (row[0] if row else 0) + delta
+        if files > 0:
+            cursor.execute('INSERT OR REPLACE INTO name_tokens (token, files) VALUES (?, ?)', (token, files))
+            if row is None:
+                added.append(token)
+        elif row is not None:
+            cursor.execute('DELETE FROM name_tokens WHERE token = ?', (token,))
+            removed.append(token)
+    cursor.executemany(
+        'INSERT OR IGNORE INTO token_deletes (variant, token) VALUES (?, ?)',
+        ((variant, token) for token in added for variant in token_variants(token))
+    )
+    cursor.executemany(
+        'DELETE FROM token_deletes WHERE variant = ? AND token = ?',
+        ((variant, token) for token in removed for variant in token_variants(token))
+    )
 
-
-
-# Function to remove the old SQLite database file if it exists
+# Function to remove the old SQLite database file if it exists, with its write-ahead log
 def remove_database(db_file):
+    for companion in (db_file + "-wal", db_file + "-shm"):
+        if os.path.exists(companion):
+            os.remove(companion)
     if os.path.exists(db_file):
         os.remove(db_file)
         print(f"Deleted existing database: {db_file}")
     else:
         print(f"No existing database found at: {db_file}")
 
-# Function to initialize the SQLite database and create the table
+# Function to copy a rebuilt database over the live one with SQLite's backup API, in a single
+# locked transaction. Renaming over a WAL database that the app, the search daemon or a
+# watching indexer has open would pair the new file with the old one's -wal and -shm files;
+# this way readers see the old index or the new one, never a mix or a half-built one.
+def install_database(conn, db_file):
+    live_conn = sqlite3.connect(db_file, timeout=LOCK_TIMEOUT)
+    try:
+        conn.backup(live_conn)
+    finally:
+        live_conn.close()
+
+# Function to tune SQLite for bulk writes while the app keeps reading the database
+def configure_db(conn):
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    conn.execute('PRAGMA cache_size = -65536')  # 64 MiB
+
+# Layout of the index. Every directory is stored once and files refer to it by id, with the
+# size and the mtime (integer microseconds since the epoch) as integers, so a row holds little
+# more than the file name. The app loads ids and normalized names in rowid order, a straight
+# scan of the files table, and paths are put back together from directory and name only for
+# the rows a search returns. The unique index on (dir_id, name) keeps every file in it once
+# and finds the files of a directory, or a file by name, for the indexer. The trigram index,
+# the token dictionary and the extracted content complete it.
+SCHEMA_VERSION = 2  # Stored as PRAGMA user_version; databases without one use the old file_index layout
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS directories (
+        id INTEGER PRIMARY KEY,
+        path TEXT NOT NULL UNIQUE
+    );
+    CREATE TABLE IF NOT EXISTS files (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        dir_id INTEGER NOT NULL REFERENCES directories (id),
+        name TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        mtime INTEGER NOT NULL,
+        norm_name TEXT NOT NULL
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS files_dir_name ON files (dir_id, name);
+
+    -- Trigram full-text index over the normalized names, so the app's substring lookups
+    -- are index probes instead of full table scans
+    CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+        norm_name, content='files', content_rowid='id', tokenize='trigram'
+    );
+    CREATE TRIGGER IF NOT EXISTS files_ai AFTER INSERT ON files BEGIN
+        INSERT INTO files_fts(rowid, norm_name) VALUES (new.id, new.norm_name);
+    END;
+    CREATE TRIGGER IF NOT EXISTS files_ad AFTER DELETE ON files BEGIN
+        INSERT INTO files_fts(files_fts, rowid, norm_name) VALUES ('delete', old.id, old.norm_name);
+    END;
+    CREATE TRIGGER IF NOT EXISTS files_au AFTER UPDATE OF norm_name ON files BEGIN
+        INSERT INTO files_fts(files_fts, rowid, norm_name) VALUES ('delete', old.id, old.norm_name);
+        INSERT INTO files_fts(rowid, norm_name) VALUES (new.id, new.norm_name);
+    END;
+
+    -- Dictionary of the words in the normalized names, with the number of files containing
+    -- each, and the deletion variants of every word for typo-tolerant candidate lookups
+    CREATE TABLE IF NOT EXISTS name_tokens (
+        token TEXT PRIMARY KEY,
+        files INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS token_deletes (
+        variant TEXT NOT NULL,
+        token TEXT NOT NULL,
+        PRIMARY KEY (variant, token)
+    ) WITHOUT ROWID;
+
+    -- Title, author and opening text extracted from the PDFs, keyed by the size and mtime
+    -- they were extracted at, with a full-text index over their normalized text
+    CREATE TABLE IF NOT EXISTS pdf_content (
+        file_id INTEGER PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime INTEGER NOT NULL,
+        title TEXT,
+        author TEXT,
+        norm_text TEXT
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS pdf_content_fts USING fts5(
+        norm_text, content='pdf_content', content_rowid='file_id'
+    );
+    CREATE TRIGGER IF NOT EXISTS pdf_content_ai AFTER INSERT ON pdf_content BEGIN
+        INSERT INTO pdf_content_fts(rowid, norm_text) VALUES (new.file_id, new.norm_text);
+    END;
+    CREATE TRIGGER IF NOT EXISTS pdf_content_ad AFTER DELETE ON pdf_content BEGIN
+        INSERT INTO pdf_content_fts(pdf_content_fts, rowid, norm_text)
+        VALUES ('delete', old.file_id, old.norm_text);
+    END;
+'''
+
+# Function to convert an ISO mtime of the old layout to the integer the index stores now. The
+# old strings were written by datetime.fromtimestamp(), so this gives exactly what
+# library.file_mtime() gives for the same file, and unchanged files stay unchanged.
+def iso_mtime(modified):
+    moment = datetime.fromisoformat(modified)
+    return int(moment.replace(microsecond=0).timestamp()) * 1_000_000 + moment.microsecond
+
+# Function to migrate a database in the old layout, a file_index table holding the absolute
+# path and an ISO mtime of every file, to the current one in a single transaction. File ids are
+# kept, so extracted content stays attached to its file.
+def migrate_file_index(conn):
+    print(f"Migrating the index to schema version {SCHEMA_VERSION}")
+    conn.create_function('dirname', 1, os.path.dirname, deterministic=True)
+    conn.create_function('iso_mtime', 1, iso_mtime, deterministic=True)
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(file_index)')]
+    has_content = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'pdf_content'").fetchone()
+
+    conn.executescript(f'''
+        BEGIN;
+        DROP TRIGGER IF EXISTS file_index_ai;
+        DROP TRIGGER IF EXISTS file_index_ad;
+        DROP TRIGGER IF EXISTS file_index_au;
+        DROP TRIGGER IF EXISTS pdf_content_ai;
+        DROP TRIGGER IF EXISTS pdf_content_ad;
+        DROP TABLE IF EXISTS file_index_fts;
+        DROP TABLE IF EXISTS pdf_content_fts;
+        {'ALTER TABLE pdf_content RENAME TO old_pdf_content;' if has_content else ''}
+        {SCHEMA}
+        INSERT INTO directories (path) SELECT DISTINCT dirname(path) FROM file_index;
+        INSERT INTO files (id, dir_id, name, size, mtime, norm_name)
+        SELECT f.id, d.id, f.name, f.size, iso_mtime(f.modified),
+               {'f.norm_name' if 'norm_name' in columns else 'normalize_text(f.name)'}
+        FROM file_index f JOIN directories d ON d.path = dirname(f.path);
+        {"""
+        INSERT INTO pdf_content (file_id, size, mtime, title, author, norm_text)
+        SELECT f.id, c.size, iso_mtime(c.modified), c.title, c.author, c.norm_text
+        FROM old_pdf_content c JOIN file_index f ON f.path = c.path;
+        DROP TABLE old_pdf_content;
+        """ if has_content else ''}
+        DROP TABLE file_index;
+        PRAGMA user_version = {SCHEMA_VERSION};
+        COMMIT;
+    ''')
+    conn.execute('VACUUM')  # Hand the space of the repeated paths back to the file system
+
+# Function to prepare a database of schema version 1 for the unique index on (dir_id, name):
+# two indexers syncing it at once could insert the same file twice, the oldest row is kept
+def remove_duplicate_files(conn):
+    cursor = conn.cursor()
+    duplicates = cursor.execute('''
+        SELECT f.id, f.norm_name FROM files f
+        WHERE EXISTS (SELECT 1 FROM files g WHERE g.dir_id = f.dir_id AND g.name = f.name AND g.id < f.id)
+    ''').fetchall()
+    token_deltas = Counter()
+    for _, norm_name in duplicates:
+        token_deltas.subtract(set(name_tokens(norm_name)))
+    cursor.executemany('DELETE FROM files WHERE id = ?', [(file_id,) for file_id, _ in duplicates])
+    update_token_index(cursor, token_deltas)
+    cursor.execute('DROP INDEX IF EXISTS files_dir_id')  # Covered by the unique index
+    if duplicates:
+        print(f"Removed {len(duplicates)} duplicate files from the index")
+
+# Function to initialize the SQLite database and create the tables, migrating a database in
+# the old layout first
 def initialize_db(db_file):
-    conn = sqlite3.connect(db_file)
+    conn = sqlite3.connect(db_file, timeout=LOCK_TIMEOUT)
+    configure_db(conn)
+    conn.create_function('normalize_text', 1, normalize_text, deterministic=True)
     cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS file_index (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            path TEXT UNIQUE,
-            name TEXT,
-            size INTEGER,
-            modified TEXT
-        )
-    ''')
+    has_tokens = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'name_tokens'"
+    ).fetchone()
+    version = cursor.execute('PRAGMA user_version').fetchone()[0]
+    if version < SCHEMA_VERSION and cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'file_index'"
+    ).fetchone():
+        migrate_file_index(conn)
+    elif version == 1:
+        remove_duplicate_files(conn)
+
+    cursor.executescript(SCHEMA)
+    if not has_tokens:
+        deltas = Counter()
+        for (norm_name,) in cursor.execute('SELECT norm_name FROM files').fetchall():
+            deltas.update(set(name_tokens(norm_name)))
+        update_token_index(cursor, deltas)
+    cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
     conn.commit()
     return conn
 
-# Function to count total number of files and show progress while counting
-def count_files(base_dir):
-    total_files = 0
-    for root, dirs, files in os.walk(base_dir):
-        total_files += len(files)
-        print(f"Counting files... {total_files} found", end="\r")  # Update count in terminal
-    print(f"\nTotal files to index: {total_files}")
-    return total_files
-
-# Recursively walk through the directory and subdirectories and index the files
-def index_files(base_dir, conn, total_files):
+# Scan a single directory and return its (directory, name, size, mtime) file rows and its
+# subdirectories. os.scandir hands out the directory type with each entry, so the only
+# extra system call per file is the one stat() whose result DirEntry caches. When a
+# directories dict is passed, the mtime of every subdirectory is recorded in it for watch mode.
+def scan_directory(directory, directories=None):
+    parent = os.path.normpath(directory)
+    files = []
+    subdirs = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                        if directories is not None:
+                            directories[entry.path] = entry.stat(follow_symlinks=False).st_mtime_ns
+                    elif entry.is_file():
+                        stat = entry.stat()
+                        files.append((parent, entry.name, stat.st_size, library.file_mtime(stat.st_mtime)))
+                except OSError:
+                    continue  # File vanished or is unreadable
+    except OSError:
+        pass  # Directory vanished or is unreadable
+    return files, subdirs
+
+# Function to record the mtime of the directory a scan starts from
+def record_directory(directory, directories):
+    if directories is not None:
+        try:
+            directories[directory] = os.stat(directory).st_mtime_ns
+        except OSError:
+            pass
+
+# Walk the directory tree in a single pass and yield a row for every file
+def scan_files(base_dir, directories=None):
+    record_directory(base_dir, directories)
+    pending = [base_dir]
+    while pending:
+        files, subdirs = scan_directory(pending.pop(), directories)
+        pending.extend(subdirs)
+        yield from files
+
+# Walk the directory tree with a pool of threads scanning directories concurrently and yield
+# a row for every file. On a network mount each scandir/stat is a round-trip, so keeping
+# several in flight hides the latency. Rows travel to the caller, the single SQLite writer,
+# through a bounded queue so a slow writer throttles the scanners instead of piling up memory.
+def scan_files_parallel(base_dir, workers, directories=None):
+    record_directory(base_dir, directories)
+    results = queue.Queue(maxsize=QUEUE_SIZE)
+    stopped = threading.Event()
+    lock = threading.Lock()
+    pending = 1
+    executor = ThreadPoolExecutor(max_workers=workers)
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def scan(directory):
+        nonlocal pending
+        try:
+            files, subdirs = scan_directory(directory, directories)
+            with lock:
+                pending += len(subdirs)
+            for subdir in subdirs:
+                executor.submit(scan, subdir)
+            if files:
+                put(files)
+        finally:
+            with lock:
+                pending -= 1
+                done = pending == 0
+            if done:
+                put(None)  # Every directory has been scanned
+
+    executor.submit(scan, base_dir)
+    try:
+        while True:
+            files = results.get()
+            if files is None:
+                break
+            yield from files
+    finally:
+        stopped.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+# Function to load the id, size and mtime of every indexed file, keyed on its (directory,
+# name), or only of the files below a directory, or only of the files directly in it when
+# not recursive
+def load_existing(conn, directory=None, recursive=True):
     cursor = conn.cursor()
+    query = 'SELECT d.path, f.name, f.id, f.size, f.mtime FROM files f JOIN directories d ON d.id = f.dir_id'
+    if directory is None:
+        cursor.execute(query)
+    elif recursive:
+        directory = os.path.normpath(directory)
+        prefix = os.path.join(directory, '')
+        upper = prefix[:-1] + chr(ord(os.sep) + 1)  # Every path starting with prefix sorts below this
+        cursor.execute(f'{query} WHERE d.path = ? OR (d.path >= ? AND d.path < ?)', (directory, prefix, upper))
+    else:
+        cursor.execute(f'{query} WHERE d.path = ?', (os.path.normpath(directory),))
+    return {(path, name): (file_id, size, mtime) for path, name, file_id, size, mtime in cursor}
+
+# Sync the index with a stream of (directory, name, size, mtime) rows. Only new and changed
+# files are written, in executemany batches, and rows of vanished files are deleted, all in
+# one transaction so the app never sees a half-updated index. With a directory, the rows
+# describe only that part of the tree and rows elsewhere are left alone. The write lock is
+# taken before the index is read, so another indexer syncing the same database (a manual run
+# next to --watch) waits for this sync instead of inserting the same files again.
+def sync_index(conn, files, directory=None, recursive=True):
+    seen = set()
+    inserts = []
+    updates = []
+    token_deltas = Counter()  # Change in the number of files containing each name token
     processed_files = 0
+    inserted = updated = 0
+    last_progress = time.monotonic()
 
-    for root, dirs, files in os.walk(base_dir):
-        for file in files:
-            file_path = os.path.join(root, file)
-            file_info = {
-                "path": file_path,
-                "name": file,
-                "size": os.path.getsize(file_path),
-                "modified": datetime.fromtimestamp(os.path.getmtime(file_path)).isoformat()
-            }
-            # Insert or update file info in the database
-            cursor.execute('''
-                INSERT OR REPLACE INTO file_index (path, name, size, modified)
-                VALUES (:path, :name, :size, :modified)
-            ''', file_info)
+    def directory_id(path):
+        dir_id = directory_ids.get(path)
+        if dir_id is None:
+            dir_id = cursor.execute('INSERT INTO directories (path) VALUES (?)', (path,)).lastrowid
+            directory_ids[path] = dir_id
+        return dir_id
 
-            # Update and display progress
+    def flush():
+        cursor.executemany('''
+            INSERT INTO files (dir_id, name, size, mtime, norm_name)
+            VALUES (?, ?, ?, ?, ?)
+        ''', inserts)
+        cursor.executemany('''
+            UPDATE files SET size = ?, mtime = ? WHERE id = ?
+        ''', updates)
+        inserts.clear()
+        updates.clear()
+
+    with conn:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        existing = load_existing(conn, directory, recursive)
+        directory_ids = dict(cursor.execute('SELECT path, id FROM directories'))
+        for parent, file, size, mtime in files:
+            key = (parent, file)
+            seen.add(key)
+
+            previous = existing.get(key)
+            if previous is None:
+                norm_name = normalize_text(file)
+                inserts.append((directory_id(parent), file, size, mtime, norm_name))
+                token_deltas.update(set(name_tokens(norm_name)))
+                inserted += 1
+            elif previous[1:] != (size, mtime):
+                updates.append((size, mtime, previous[0]))
+                updated += 1
+            if len(inserts) + len(updates) >= BATCH_SIZE:
+                flush()
+
+            # Update and display progress, throttled to keep the terminal from becoming the bottleneck
             processed_files += 1
-            print(f"Processed {processed_files} of {total_files} files", end="\r")
+            now = time.monotonic()
+            if now - last_progress >= PROGRESS_INTERVAL:
+                print(f"Processed {processed_files} files", end="\r")
+                last_progress = now
 
-    conn.commit()
+        flush()
+        removed = [(existing[key][0],) for key in existing.keys() - seen]
+        for file_id in removed:
+            row = cursor.execute('SELECT norm_name FROM files WHERE id = ?', file_id).fetchone()
+            token_deltas.subtract(set(name_tokens(row[0])))
+        cursor.executemany('DELETE FROM files WHERE id = ?', removed)
+        if removed:
+            cursor.execute('''
+                DELETE FROM directories
+                WHERE NOT EXISTS (SELECT 1 FROM files WHERE files.dir_id = directories.id)
+            ''')
+        update_token_index(cursor, token_deltas)
 
-# Main function to index the directory
-def main():
-    print("Starting the reindexing process...")
+    print(f"Processed {processed_files} files")
+    print(f"Added {inserted}, updated {updated}, removed {len(removed)} files")
+    return processed_files
+
+# Recursively walk through the directory and subdirectories and sync the index with it.
+# With more than one worker the tree is scanned concurrently, the resulting index is the same.
+def index_files(base_dir, conn, workers=1, directories=None):
+    if workers > 1:
+        return sync_index(conn, scan_files_parallel(base_dir, workers, directories))
+    return sync_index(conn, scan_files(base_dir, directories))
+
+# Function to run a poppler tool and return its output, or an empty string if it fails
+def run_poppler(args):
+    try:
+        result = subprocess.run(args, capture_output=True, timeout=EXTRACT_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        return ''
+    return result.stdout.decode('utf-8', errors='replace') if result.returncode == 0 else ''
 
-    # Step 1: Remove the existing database if it exists
-    remove_database(DB_FILE)
+# Extract the title and author metadata and the text of the first pages of a PDF. Runs in
+# a worker process; unreadable PDFs yield empty fields so they are not retried on every run.
+def extract_pdf(path):
+    title = author = ''
+    for line in run_poppler(['pdfinfo', path]).splitlines():
+        key, _, value = line.partition(':')
+        if key == 'Title':
+            title = value.strip()
+        elif key == 'Author':
+            author = value.strip()
+    text = run_poppler(['pdftotext', '-q', '-l', str(EXTRACT_PAGES), path, '-'])
+    return title, author, ' '.join(text.split())[:EXTRACT_MAX_CHARS]
 
-    # Step 2: Initialize a new SQLite database
-    conn = initialize_db(DB_FILE)
+# Function to copy the extracted content of unchanged PDFs over from another index database,
+# matching files by directory and name since ids differ between databases
+def copy_content(conn, db_file):
+    if not os.path.exists(db_file):
+        return
+    initialize_db(db_file).close()  # Migrate an index in the old layout first
+    conn.execute('ATTACH DATABASE ? AS previous', (db_file,))
+    try:
+        with conn:
+            conn.execute('''
+                INSERT OR IGNORE INTO pdf_content (file_id, size, mtime, title, author, norm_text)
+                SELECT f.id, c.size, c.mtime, c.title, c.author, c.norm_text
+                FROM previous.pdf_content c
+                JOIN previous.files pf ON pf.id = c.file_id
+                JOIN previous.directories pd ON pd.id = pf.dir_id
+                JOIN directories d ON d.path = pd.path
+                JOIN files f ON f.dir_id = d.id AND f.name = pf.name
+                            AND f.size = c.size AND f.mtime = c.mtime
+            ''')
+    finally:
+        conn.execute('DETACH DATABASE previous')
 
-    # Step 3: Count the total number of files and show progress
-    print("Counting total files in:", BASE_DIR)
-    total_files = count_files(BASE_DIR)
+# Extract the content of every PDF that is new or changed since it was last extracted, in a
+# pool of worker processes, and drop the content of PDFs that left the index. Results are
+# committed batch by batch, so an interrupted run keeps what it extracted.
+def extract_content(conn, workers):
+    if not (shutil.which('pdfinfo') and shutil.which('pdftotext')):
+        print("pdfinfo/pdftotext not found (poppler-utils), skipping content extraction")
+        return 0
 
-    # Step 4: Index the files in the directory
-    index_files(BASE_DIR, conn, total_files)
+    with conn:
+        conn.execute('DELETE FROM pdf_content WHERE file_id NOT IN (SELECT id FROM files)')
+    pending = conn.execute('''
+        SELECT f.id, d.path, f.name, f.size, f.mtime FROM files f
+        JOIN directories d ON d.id = f.dir_id
+        LEFT JOIN pdf_content c ON c.file_id = f.id
+        WHERE lower(f.name) LIKE '%.pdf'
+          AND (c.file_id IS NULL OR c.size != f.size OR c.mtime != f.mtime)
+    ''').fetchall()
+    if not pending:
+        return 0
+    print(f"Extracting content of {len(pending)} PDFs")
 
-    # Step 5: Close the database connection
+    extracted = 0
+    last_progress = time.monotonic()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        paths = [os.path.join(directory, name) for _, directory, name, _, _ in pending]
+        results = executor.map(extract_pdf, paths, chunksize=4)
+        for start in range(0, len(pending), BATCH_SIZE):
+            rows = []
+            for file_id, _, _, size, mtime in pending[start:start + BATCH_SIZE]:
+                title, author, text = next(results)
+                norm_text = normalize_text(' '.join((title, author, text)))
+                rows.append((file_id, size, mtime, title, author, norm_text))
+
+                extracted += 1
+                now = time.monotonic()
+                if now - last_progress >= PROGRESS_INTERVAL:
+                    print(f"Extracted {extracted} of {len(pending)} PDFs", end="\r")
+                    last_progress = now
+
+            with conn:
+                conn.executemany('DELETE FROM pdf_content WHERE file_id = ?', [(row[0],) for row in rows])
+                conn.executemany('''
+                    INSERT INTO pdf_content (file_id, size, mtime, title, author, norm_text)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', rows)
+
+    print(f"Extracted {extracted} of {len(pending)} PDFs")
+    return extracted
+
+# Render the first-page thumbnails of the count most recently modified PDFs that are not in
+# the thumbnail cache yet, so that new scans show a preview the first time they are listed.
+# Each render is a pdftoppm process, so a thread pool is enough to keep several running.
+def render_thumbnails(conn, count, workers):
+    if not shutil.which('pdftoppm'):
+        print("pdftoppm not found (poppler-utils), skipping thumbnails")
+        return 0
+    recent = conn.execute('''
+        SELECT d.path, f.name, f.size, f.mtime FROM files f JOIN directories d ON d.id = f.dir_id
+        WHERE lower(f.name) LIKE '%.pdf' ORDER BY f.mtime DESC LIMIT ?
+    ''', (count,)).fetchall()
+    rows = [(os.path.join(directory, name), size, mtime) for directory, name, size, mtime in recent]
+    missing = [
+        row for row in rows
+        if not os.path.exists(thumbnails.thumbnail_file(*row))
+    ]
+    if not missing:
+        return 0
+
+    rendered = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for path in executor.map(lambda row: thumbnails.render_thumbnail(*row), missing):
+            rendered += path is not None
+            print(f"Rendered {rendered} of {len(missing)} thumbnails", end="\r")
+    print(f"Rendered {rendered} of {len(missing)} thumbnails")
+    thumbnails.evict_thumbnails()
+    return rendered
+
+# Minimal ctypes binding to Linux inotify, reporting (directory, name, mask) events for a
+# set of watched directories. Watches are not recursive, every directory is added on its own.
+class Inotify:
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}  # Watch descriptor -> directory
+        self.directories = set()  # Paths being watched, a directory moved away leaves them
+
+    def add_watch(self, directory):
+        if directory in self.directories:
+            return
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            if ctypes.get_errno() == errno.ENOSPC:
+                print("Out of inotify watches, raise fs.inotify.max_user_watches; relying on sweeps")
+            return
+        # A directory that moved keeps its watch, which the kernel hands back for the new path
+        self.directories.discard(self.watches.get(wd))
+        self.watches[wd] = directory
+        self.directories.add(directory)
+
+    def wait(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        return bool(readable)
+
+    def read_events(self):
+        events = []
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return events
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = struct.unpack_from('iIII', data, offset)
+            offset += INOTIFY_EVENT_SIZE
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            directory = self.watches.get(wd)
+            if mask & IN_IGNORED:
+                # The directory is gone and the kernel dropped its watch
+                self.watches.pop(wd, None)
+                self.directories.discard(directory)
+            elif directory is not None or mask & IN_Q_OVERFLOW:
+                if mask & (IN_MOVE_SELF | IN_DELETE_SELF):
+                    # Nothing is watched at the old paths any more, a directory created
+                    # there gets a watch of its own
+                    self.directories -= {path for path in self.directories if is_below(path, directory)}
+                events.append((directory, name, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+# Function to open an inotify instance, or return None where inotify is not available
+def open_inotify():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        return Inotify()
+    except (OSError, AttributeError):
+        return None
+
+# Function to check whether a path is a directory or lies below it
+def is_below(path, directory):
+    return path == directory or path.startswith(os.path.join(directory, ''))
+
+# Function to resync the whole tree below a directory that appeared, moved or vanished
+def sync_tree(conn, directory, directories, inotify):
+    for path in [path for path in directories if is_below(path, directory)]:
+        del directories[path]
+    sync_index(conn, scan_files(directory, directories), directory)
+    if inotify is not None:
+        for path in directories:
+            if is_below(path, directory):
+                inotify.add_watch(path)
+
+# Function to resync the files directly in a directory; subdirectories not seen before are
+# synced as whole trees
+def sync_directory(conn, directory, directories, inotify):
+    known = set(directories)
+    record_directory(directory, directories)
+    files, subdirs = scan_directory(directory, directories)
+    sync_index(conn, files, directory, recursive=False)
+    for subdir in subdirs:
+        if subdir not in known:
+            sync_tree(conn, subdir, directories, inotify)
+
+# Fallback for network mounts, which do not deliver inotify events for changes made on other
+# machines: stat every known directory and rescan only those whose mtime changed. Adding,
+# removing or renaming a file changes the mtime of its directory, so new scans are found for
+# one round-trip per directory instead of one per file.
+def sweep(conn, base_dir, directories, inotify):
+    if not os.path.isdir(base_dir):
+        print(f"Directory to index not reachable, skipping sweep: {base_dir}")
+        return
+    for directory, mtime in list(directories.items()):
+        if directory not in directories:
+            continue  # Dropped along with a vanished parent earlier in this sweep
+        try:
+            current = os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            sync_tree(conn, directory, directories, inotify)  # Deletes the rows below it
+            continue
+        except OSError:
+            continue  # Transient network error, retried on the next sweep
+        if current != mtime:
+            sync_directory(conn, directory, directories, inotify)
+
+# Function to apply a burst of coalesced inotify events as a few small transactions: trees of
+# created, moved or deleted directories are resynced whole, other touched directories shallowly
+def apply_events(conn, events, directories, inotify):
+    trees = set()
+    touched = set()
+    for directory, name, mask in events:
+        if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE):
+            trees.add(os.path.join(directory, name))
+        elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            trees.add(directory)
+        else:
+            touched.add(directory)
+
+    for tree in sorted(trees):
+        sync_tree(conn, tree, directories, inotify)
+    for directory in sorted(touched):
+        if not any(is_below(directory, tree) for tree in trees):
+            sync_directory(conn, directory, directories, inotify)
+
+# Keep the index current until interrupted: apply inotify events once a burst of them has
+# ended, and sweep for the changes inotify cannot see every sweep_interval seconds. With
+# content_workers, the content of new and changed PDFs is extracted after every change.
+def watch(base_dir, conn, directories, sweep_interval, content_workers=0):
+    inotify = open_inotify()
+    if inotify is not None:
+        for directory in list(directories):
+            inotify.add_watch(directory)
+        print(f"Watching {len(inotify.directories)} directories for changes")
+    else:
+        print("inotify not available, relying on periodic sweeps")
+
+    next_sweep = time.monotonic() + sweep_interval
+    try:
+        while True:
+            timeout = max(0.0, next_sweep - time.monotonic())
+            if inotify is None:
+                time.sleep(timeout)
+            elif inotify.wait(timeout):
+                # Coalesce the burst: keep reading until no event arrived for COALESCE_DELAY
+                events = inotify.read_events()
+                deadline = time.monotonic() + MAX_COALESCE_DELAY
+                while time.monotonic() < deadline and inotify.wait(COALESCE_DELAY):
+                    events.extend(inotify.read_events())
+                if any(mask & IN_Q_OVERFLOW for _, _, mask in events):
+                    next_sweep = time.monotonic()  # Events were lost, sweep right away
+                else:
+                    apply_events(conn, events, directories, inotify)
+                    if content_workers:
+                        extract_content(conn, content_workers)
+
+            if time.monotonic() >= next_sweep:
+                sweep(conn, base_dir, directories, inotify)
+                if content_workers:
+                    extract_content(conn, content_workers)
+                next_sweep = time.monotonic() + sweep_interval
+    finally:
+        if inotify is not None:
+            inotify.close()
+
+# Index one root of the library into its shard database and, in watch mode, keep the shard
+# current until the process ends. Every root runs in its own thread with its own database
+# connection, so a slow or offline root holds up only its own shard. In watch mode a root that
+# is offline is looked for again every sweep interval, so a share mounted later gets indexed.
+def index_root(root, args, content_workers):
+    # An unmounted share would look like every file was deleted, so refuse to sync against it
+    if not os.path.isdir(root.path):
+        print(f"[{root.name}] Directory to index not found, keeping its shard as it is: {root.path}")
+        if not args.watch:
+            return
+        while not os.path.isdir(root.path):
+            time.sleep(args.sweep_interval)
+        print(f"[{root.name}] Directory to index found: {root.path}")
+
+    # A full rebuild is written to a temporary file that is copied into the shard once complete
+    db_file = root.db_file + ".tmp" if args.full else root.db_file
+
+    # Step 1: Remove a temporary database left over from an interrupted rebuild
+    if args.full:
+        remove_database(db_file)
+
+    # Step 2: Initialize the SQLite database
+    conn = initialize_db(db_file)
+
+    # Step 3: Sync the index with the files in the directory, recording directory mtimes to watch
+    print(f"[{root.name}] Indexing files in: {root.path}")
+    directories = {} if args.watch else None
+    index_files(root.path, conn, args.workers, directories)
+
+    # Step 4: Extract the content of new and changed PDFs, reusing what a rebuilt index had,
+    # and render thumbnails of the newest ones
+    if content_workers:
+        if args.full:
+            copy_content(conn, root.db_file)
+        extract_content(conn, content_workers)
+    if args.thumbnails:
+        render_thumbnails(conn, args.thumbnails, args.content_workers)
+
+    # Step 5: Copy the rebuilt database into the shard and close the database connection
+    if args.full:
+        install_database(conn, root.db_file)
     conn.close()
-    print(f"\nIndex stored in SQLite database {DB_FILE}")
+    if args.full:
+        remove_database(db_file)
+    print(f"[{root.name}] Index stored in SQLite database {root.db_file}")
+
+    # Step 6: Keep the index current until the process ends
+    if args.watch:
+        conn = initialize_db(root.db_file)
+        try:
+            watch(root.path, conn, directories, args.sweep_interval, content_workers)
+        finally:
+            conn.close()
+
+# Main function to index every root of the library listed in config.json
+def main():
+    # Set the working directory to the directory of this script
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    parser = argparse.ArgumentParser(description="Index the sheet music library into SQLite.")
+    parser.add_argument("--full", action="store_true",
+                        help="rebuild the database from scratch instead of updating it")
+    parser.add_argument("--root", action="append", metavar="NAME",
+                        help="index only this root of config.json, repeatable (default: every root)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"number of directories scanned concurrently per root (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--content", action="store_true",
+                        help="extract PDF metadata and first-page text into the full-text index")
+    parser.add_argument("--content-workers", type=int, default=os.cpu_count(),
+                        help="number of processes extracting PDF content, shared by the roots (default: number of CPUs)")
+    parser.add_argument("--thumbnails", type=int, default=0, metavar="COUNT",
+                        help="pre-render first-page thumbnails of the COUNT most recently modified PDFs of each root")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and apply changes to the index as they happen")
+    parser.add_argument("--sweep-interval", type=float, default=DEFAULT_SWEEP_INTERVAL,
+                        help=f"seconds between directory mtime sweeps in watch mode (default: {DEFAULT_SWEEP_INTERVAL})")
+    args = parser.parse_args()
+
+    roots = library.load_roots()
+    if args.root:
+        unknown = set(args.root) - {root.name for root in roots}
+        if unknown:
+            sys.exit(f"Not a root in config.json: {', '.join(sorted(unknown))}")
+        roots = [root for root in roots if root.name in args.root]
+    if not roots:
+        sys.exit("No roots to index in config.json")
+    print("Starting the full reindexing process..." if args.full else "Starting the incremental reindexing process...")
+
+    # Index the roots concurrently, each into its own shard. The threads are daemons, so an
+    # interrupt does not wait for a share that stopped answering.
+    content_workers = max(1, args.content_workers // len(roots)) if args.content else 0
+    threads = [
+        threading.Thread(target=index_root, args=(root, args, content_workers), name=root.name, daemon=True)
+        for root in roots
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.5)
+    except KeyboardInterrupt:
+        print("Stopped watching" if args.watch else "Interrupted")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,110 @@
+import os
+import re
+import json
+import math
+import unicodedata
+from typing import List, NamedTuple, Set, Tuple
+
+# The library spans several roots: network shares and local disks of very different latency.
+# indexer.py indexes every root into its own shard database, each in its own thread, so a
+# slow or offline root only holds up its own shard, and the search engine merges the names
+# of every shard into one catalogue. The roots are listed in config.json:
+#
+#   "roots": [
+#     {"name": "smc", "path": "~/nas/vol1/mus/smc/", "db": "file_index.db"},
+#     {"name": "usb", "path": "/media/archive/scores"}
+#   ]
+#
+# "db" defaults to file_index-<name>.db; relative paths are relative to this directory.
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_FILE = os.path.join(SCRIPT_DIR, "config.json")
+DEFAULT_ROOTS = [{"name": "smc", "path": "~/nas/vol1/mus/smc/", "db": "file_index.db"}]
+
+# Typo-tolerant lookups: every distinct word of the normalized names is stored with the
+# strings reachable by deleting up to TYPO_MAX_DISTANCE characters from its start
+# (SymSpell's deletion neighbourhood, limited to a prefix to keep it small)
+TYPO_MIN_LENGTH = 4  # Shorter words are only ever matched exactly
+TYPO_PREFIX_LENGTH = 7
+TYPO_MAX_DISTANCE = 2
+
+# Letters that Unicode does not decompose into a base letter and a combining mark
+FOLDED_LETTERS = str.maketrans({
+    'ø': 'o', 'æ': 'ae', 'œ': 'oe', 'ß': 'ss', 'ł': 'l', 'đ': 'd', 'ð': 'd', 'þ': 'th',
+})
+
+
+class Root(NamedTuple):
+    """ One directory tree of the library and the shard database it is indexed into """
+    name: str
+    path: str
+    db_file: str
+
+
+def parse_roots(cfg: dict) -> List[Root]:
+    """ Return the roots listed in a loaded config.json, or the single default root """
+    roots = []
+    for entry in cfg.get("roots", DEFAULT_ROOTS):
+        name = entry["name"]
+        db_file = os.path.join(SCRIPT_DIR, os.path.expanduser(entry.get("db") or f"file_index-{name}.db"))
+        roots.append(Root(name, os.path.expanduser(entry["path"]), db_file))
+    for field in ("name", "db_file"):
+        values = [getattr(root, field) for root in roots]
+        if len(set(values)) != len(values):
+            raise ValueError(f"Every root in config.json needs its own {field}: {values}")
+    return roots
+
+def load_roots(config_file: str = CONFIG_FILE) -> List[Root]:
+    """ Return the roots listed in config.json """
+    try:
+        with open(config_file) as f:
+            cfg = json.load(f)
+    except FileNotFoundError:
+        cfg = {}
+    return parse_roots(cfg)
+
+def shard_files(roots: List[Root]) -> List[str]:
+    """ Return the shard databases of the roots, in the order the engine numbers them """
+    return [root.db_file for root in roots]
+
+def file_mtime(st_mtime: float) -> int:
+    """ Return an mtime as the integer microseconds since the epoch that the index stores,
+    rounded the way datetime.fromtimestamp() rounds it """
+    fraction, seconds = math.modf(st_mtime)
+    return int(seconds) * 1_000_000 + round(fraction * 1e6)
+
+def file_identity(path: str) -> Tuple[int, int]:
+    """ Return the size and mtime of a file, the way the index stores them """
+    stat = os.stat(path)
+    return stat.st_size, file_mtime(stat.st_mtime)
+
+def normalize_text(text: str) -> str:
+    """ Remove accents and convert to lowercase, so that "Grønland" and "Gronland" compare equal """
+    decomposed = unicodedata.normalize('NFD', text.lower().translate(FOLDED_LETTERS))
+    return ''.join(c for c in decomposed if unicodedata.category(c) != 'Mn')
+
+def name_tokens(norm_name: str) -> List[str]:
+    """ Split a normalized name into the words of the token dictionary """
+    return re.findall(r'[^\W_]+', norm_name)
+
+def deletion_variants(text: str) -> Set[str]:
+    """ Return the deletion neighbourhood of a string: the string and every string made by
+    deleting up to TYPO_MAX_DISTANCE characters from it. Two strings within that many edits
+    of each other share at least one variant. """
+    variants = {text}
+    frontier = variants
+    for _ in range(TYPO_MAX_DISTANCE):
+        frontier = {v[:i] + v[i + 1:] for v in frontier for i in range(len(v))} - variants
+        variants = variants | frontier
+    variants.discard('')
+    return variants
+
+def token_variants(token: str) -> Set[str]:
+    """ Return the variants a token is stored under: the deletion neighbourhoods of its starts
+    from TYPO_MIN_LENGTH up to TYPO_PREFIX_LENGTH characters, so that a query word with a typo
+    finds the token before it has been typed out in full. Shorter tokens and numbers get none. """
+    variants = set()
+    if token.isdigit():
+        return variants  # A mistyped number is another number, not a typo to forgive
+    for length in range(TYPO_MIN_LENGTH, min(len(token), TYPO_PREFIX_LENGTH) + 1):
+        variants |= deletion_variants(token[:length])
+    return variants
@@ -0,0 +1,164 @@
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import library
+
+CACHE_DIR = os.path.expanduser("~/.cache/search-scores/pdfs")
+HALF_LIFE = 7 * 24 * 3600  # Seconds after which an open counts half as much for eviction
+PREFETCH_DELAY = 0.5  # Seconds a result must stay highlighted before it is prefetched
+
+
+class PdfCache:
+    """ Local copies of frequently and recently opened PDFs from the NAS.
+
+    Opening a PDF records it in a small SQLite database next to the copies. A PDF with a
+    local copy opens from local disk; otherwise the viewer gets the NAS path and a copy is
+    made in the background for next time. The highlighted result can be prefetched the same
+    way, so pressing Return usually finds it local already.
+
+    Copies are keyed on the PDF's path, size and mtime like the thumbnails, so a changed scan
+    is never served stale. Once the copies outgrow the byte budget, the ones with the lowest
+    open count, weighted by how recently they were used, are evicted first; prefetched
+    copies that were never opened go before anything that was.
+    """
+
+    def __init__(self, budget: int, cache_dir: str = CACHE_DIR) -> None:
+        self.budget = budget
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.lock = threading.Lock()  # Serializes use of the database across threads
+        self.db_conn = sqlite3.connect(os.path.join(cache_dir, "opens.db"), check_same_thread=False)
+        self.db_conn.executescript('''
+            CREATE TABLE IF NOT EXISTS open_stats (
+                path TEXT PRIMARY KEY,
+                opens INTEGER NOT NULL DEFAULT 0,
+                last_used REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS cached_files (
+                local_path TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                bytes INTEGER NOT NULL
+            );
+        ''')
+
+        self.executor = ThreadPoolExecutor(max_workers=1)  # One NAS copy at a time
+        self.prefetch_timer: Optional[threading.Timer] = None  # Pending prefetch of the highlighted PDF
+
+    def local_file(self, pdf: str, size: int, mtime: int) -> str:
+        """ Path of the local copy of a PDF with the given size and mtime """
+        key = hashlib.sha1(f"{pdf}\0{size}\0{mtime}".encode("utf-8", "surrogateescape"))
+        # Keep the original file name, viewers show it in their title bar
+        return os.path.join(self.cache_dir, key.hexdigest(), os.path.basename(pdf))
+
+    def cached_copy(self, pdf: str) -> Optional[str]:
+        """ Return the local copy of a PDF if it is current, or None """
+        try:
+            local = self.local_file(pdf, *library.file_identity(pdf))
+        except OSError:
+            return None
+        return local if os.path.exists(local) else None
+
+    def touch(self, pdf: str, opened: bool) -> None:
+        """ Mark a PDF as used now, counting an open if it was opened """
+        with self.lock, self.db_conn:
+            self.db_conn.execute('''
+                INSERT INTO open_stats (path, opens, last_used) VALUES (?, ?, ?)
+                ON CONFLICT(path) DO UPDATE SET opens = opens + excluded.opens,
+                                                last_used = excluded.last_used
+            ''', (pdf, int(opened), time.time()))
+
+    def open_path(self, pdf: str) -> str:
+        """ Record that a PDF is being opened and return the path to hand to the viewer """
+        self.touch(pdf, opened=True)
+        local = self.cached_copy(pdf)
+        if local is None:
+            self.executor.submit(self.fetch, pdf)  # Open from the NAS now, locally next time
+            return pdf
+        return local
+
+    def prefetch(self, pdf: str) -> None:
+        """ Copy a PDF in the background unless another one is asked for within PREFETCH_DELAY """
+        # Let the highlight settle first, scrolling through results should not copy each of
+        # them. The wait runs on a timer of its own, so the copy worker is never held up by it.
+        if self.prefetch_timer is not None:
+            self.prefetch_timer.cancel()
+        self.prefetch_timer = threading.Timer(PREFETCH_DELAY, self.executor.submit, (self.fetch, pdf))
+        self.prefetch_timer.daemon = True
+        self.prefetch_timer.start()
+
+    def fetch(self, pdf: str) -> Optional[str]:
+        """ Copy a PDF into the cache unless a current copy exists, and return the copy """
+        try:
+            size, mtime = library.file_identity(pdf)
+            local = self.local_file(pdf, size, mtime)
+            if os.path.exists(local):
+                return local
+
+            # Copy next to the final file and move it into place, so a viewer never gets a partial copy
+            os.makedirs(os.path.dirname(local), exist_ok=True)
+            tmp = tempfile.NamedTemporaryFile(dir=os.path.dirname(local), delete=False)
+            try:
+                with tmp, open(pdf, "rb") as source:
+                    shutil.copyfileobj(source, tmp, 1024 * 1024)
+                os.replace(tmp.name, local)
+            except OSError:
+                os.remove(tmp.name)
+                raise
+        except OSError as e:
+            print(f"Could not cache {pdf}: {e}")
+            return None
+
+        with self.lock, self.db_conn:
+            # Copies of earlier versions of the same PDF are stale now
+            stale = self.db_conn.execute(
+                "SELECT local_path FROM cached_files WHERE path = ? AND local_path != ?", (pdf, local)
+            ).fetchall()
+            self.db_conn.execute(
+                "INSERT OR REPLACE INTO cached_files (local_path, path, bytes) VALUES (?, ?, ?)",
+                (local, pdf, size)
+            )
+            self.db_conn.execute(
+                "INSERT OR IGNORE INTO open_stats (path, opens, last_used) VALUES (?, 0, ?)",
+                (pdf, time.time())
+            )
+        for (stale_path,) in stale:
+            self.remove(stale_path)
+        self.evict()
+        return local
+
+    def remove(self, local: str) -> None:
+        """ Delete a local copy and forget it """
+        shutil.rmtree(os.path.dirname(local), ignore_errors=True)
+        with self.lock, self.db_conn:
+            self.db_conn.execute("DELETE FROM cached_files WHERE local_path = ?", (local,))
+
+    def evict(self) -> None:
+        """ Delete the least valuable copies until the cache fits its byte budget """
+        with self.lock:
+            rows = self.db_conn.execute('''
+                SELECT c.local_path, c.bytes, coalesce(s.opens, 0), coalesce(s.last_used, 0)
+                FROM cached_files c LEFT JOIN open_stats s ON s.path = c.path
+            ''').fetchall()
+        total = sum(row[1] for row in rows)
+        if total <= self.budget:
+            return
+
+        now = time.time()
+        def value(row):
+            # Copies never opened go first, however recently they were prefetched
+            _, _, opens, last_used = row
+            return opens > 0, (opens + 1) * 0.5 ** ((now - last_used) / HALF_LIFE)
+
+        for local, size, _, _ in sorted(rows, key=value):
+            if total <= self.budget:
+                break
+            self.remove(local)
+            total -= size
@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import time
+import errno
+import socket
+import subprocess
+from typing import List, Optional, Tuple
+import timing
+
+# Client side of the search daemon protocol described in search_daemon.py. It only needs
+# the standard library, so a frontend that queries the daemon starts without loading
+# numpy, rapidfuzz or the index itself.
+SOCKET_PATH = os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR") or os.path.expanduser("~/.cache"), "search-scores.sock"
+)
+DAEMON_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "search_daemon.py")
+CLIENT_TIMEOUT = 30  # Seconds a client waits for a reply before giving up on the daemon
+START_TIMEOUT = 60  # Seconds a client waits for a daemon it started to load the catalogue
+
+
+class SearchClient:
+    """ Connection to the search daemon, with the same search() as SearchEngine.
+
+    The connection is made on the first search and kept open. If no daemon is listening
+    and start_daemon is set, one is started in the background and the search waits for it
+    to load the catalogue. A dropped connection is retried once, for a restarted daemon.
+    """
+
+    def __init__(self, socket_path: str = SOCKET_PATH, db_files: Optional[List[str]] = None,
+                 start_daemon: bool = True, in_memory: bool = False) -> None:
+        self.socket_path = socket_path
+        self.db_files = db_files  # Shards a daemon started by this client loads, None for config.json's
+        self.start_daemon = start_daemon
+        self.in_memory = in_memory  # Have a daemon started by this client copy the index into memory
+        self.sock: Optional[socket.socket] = None
+        self.stream = None
+
+    def connect(self) -> None:
+        try:
+            self.sock = self.open_socket()
+        except (FileNotFoundError, ConnectionRefusedError):
+            if not self.start_daemon:
+                raise
+            self.sock = self.launch_daemon()
+        self.sock.settimeout(CLIENT_TIMEOUT)
+        self.stream = self.sock.makefile("rb")
+
+    def open_socket(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def launch_daemon(self) -> socket.socket:
+        """ Start a daemon in its own session, so it outlives this client, and connect to it """
+        command = [sys.executable, DAEMON_SCRIPT, "--socket", self.socket_path]
+        for db_file in self.db_files or []:
+            command += ["--db", os.path.abspath(db_file)]
+        if self.in_memory:
+            command.append("--in-memory")
+        subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                         start_new_session=True)
+        deadline = time.monotonic() + START_TIMEOUT
+        while True:
+            try:
+                return self.open_socket()
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    def close(self) -> None:
+        if self.sock is not None:
+            self.stream.close()
+            self.sock.close()
+        self.sock = None
+        self.stream = None
+
+    def request(self, message: dict) -> dict:
+        """ Send one request and return the daemon's reply """
+        line = json.dumps(message).encode("utf-8", "surrogateescape") + b"\n"
+        for attempt in range(2):
+            try:
+                if self.sock is None:
+                    self.connect()
+                self.sock.sendall(line)
+                reply = self.stream.readline()
+                if not reply:
+                    raise ConnectionResetError(errno.ECONNRESET, "The search daemon closed the connection")
+                return json.loads(reply)
+            except OSError:
+                self.close()
+                if attempt:
+                    raise
+
+    def warm_up(self) -> None:
+        """ Connect ahead of the first search, starting the daemon if it is not running """
+        if self.sock is None:
+            try:
+                self.connect()
+            except OSError as e:
+                print(f"Could not reach the search daemon at {self.socket_path}: {e}")
+
+    def search(self, query: str, limit: int = 20, mode: str = "fuzzy") -> List[Tuple[str, int]]:
+        """ Return the (path, score) of the best matches for the query, best first """
+        if not query.split():
+            return []
+        try:
+            reply = self.request({"query": query, "limit": limit, "mode": mode})
+        except OSError as e:
+            print(f"Could not reach the search daemon at {self.socket_path}: {e}")
+            return []
+        if "error" in reply:
+            print(f"Search daemon error: {reply['error']}")
+            return []
+        # Spans recorded by the daemon, so the stats overlay and timing log show them too
+        for name, seconds in reply.get("timings", []):
+            timing.record(name, seconds)
+        return [(path, score) for path, score in reply["results"]]
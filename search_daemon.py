@@ -0,0 +1,147 @@
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import argparse
+import threading
+import socketserver
+from typing import List, Tuple
+
+from library import normalize_text
+from search_engine import SearchEngine
+from search_client import SOCKET_PATH
+import library
+import timing
+
+# The search daemon keeps the catalogue loaded in a SearchEngine and answers queries from
+# the frontends over a Unix domain socket, so the index is loaded and the scoring cache
+# warmed once per boot instead of once per launch.
+#
+# The protocol is JSON lines: a client writes one request object per line and reads one
+# reply object per line, over a connection it may keep open for as many queries as it likes.
+#
+#   {"query": "mozart son", "limit": 20, "mode": "fuzzy"}
+#   {"results": [["/path/to/Mozart - Sonata.pdf", 91], ...], "timings": [["SearchEngine.search", 0.0031], ...]}
+#
+# "mode" is "fuzzy" (the default, ranked like the Qt app), "contains" or "prefix"; the last
+# two match the accent-folded query as a substring or a prefix of the folded file name and
+# score every match 100. "timings" holds the timing spans (see timing.py) recorded while
+# answering, in seconds, so the frontend can show where its searches spend their time.
+# A request that cannot be answered gets {"error": "..."} instead.
+# The client side is SearchClient in search_client.py.
+MAX_LIMIT = 10000  # Largest number of results one request may ask for
+
+
+class SearchHandler(socketserver.StreamRequestHandler):
+    """ Answers the requests of one client connection, one line at a time """
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                with timing.collect() as spans:
+                    results = self.server.search(
+                        str(request["query"]),
+                        max(0, min(int(request.get("limit", 20)), MAX_LIMIT)),
+                        request.get("mode", "fuzzy"),
+                    )
+                reply = {"results": results, "timings": spans}
+            except (ValueError, KeyError, TypeError) as e:
+                reply = {"error": f"{type(e).__name__}: {e}"}
+            try:
+                self.wfile.write(json.dumps(reply).encode("utf-8", "surrogateescape") + b"\n")
+                self.wfile.flush()
+            except OSError:
+                return  # The client went away
+
+
+class SearchServer(socketserver.ThreadingUnixStreamServer):
+    """ Serves one SearchEngine to every connected client.
+
+    Each client gets its own thread, and searches are serialized on the engine, which
+    already scores each query on every core and keeps one cache shared by all clients.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, engine: SearchEngine) -> None:
+        self.engine = engine
+        self.lock = threading.Lock()
+        super().__init__(socket_path, SearchHandler)
+
+    def search(self, query: str, limit: int, mode: str) -> List[Tuple[str, int]]:
+        if mode not in ("fuzzy", "contains", "prefix"):
+            raise ValueError(f"unknown mode {mode!r}")
+        with self.lock:
+            if mode == "fuzzy":
+                return self.engine.search(query, limit)
+            return self.filter_names(query, limit, prefix=mode == "prefix")
+
+    def filter_names(self, query: str, limit: int, prefix: bool) -> List[Tuple[str, int]]:
+        """ Return the files whose folded name contains, or starts with, the folded query """
+        needle = normalize_text(query).strip()
+        if not needle or not limit:
+            return []
+        self.engine.reload_if_changed()
+        keys = []
+        for key, name in zip(self.engine.ids.tolist(), self.engine.names):
+            if name.startswith(needle) if prefix else needle in name:
+                keys.append(key)
+                if len(keys) == limit:
+                    break
+        paths = self.engine.file_paths(keys)
+        return [(paths[key], 100) for key in keys if key in paths]
+
+
+def remove_stale_socket(socket_path: str) -> bool:
+    """ Remove a socket file left behind by a daemon that is gone; False if one still answers """
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except FileNotFoundError:
+        return True
+    except OSError:
+        os.remove(socket_path)
+        return True
+    finally:
+        probe.close()
+    return False
+
+def serve(socket_path: str, db_files: List[str], in_memory: bool = False) -> None:
+    """ Load the catalogue and answer searches on the socket until interrupted """
+    if not remove_stale_socket(socket_path):
+        print(f"A search daemon is already listening on {socket_path}")
+        return
+
+    start = time.perf_counter()
+    engine = SearchEngine(db_files, in_memory=in_memory)
+    print(f"Loaded {len(engine.names)} files from {len(db_files)} shards in {time.perf_counter() - start:.2f} seconds")
+
+    os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+    server = SearchServer(socket_path, engine)
+    print(f"Listening on {socket_path}")
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))  # Clean up the socket on stop too
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+
+
+# Main function to run the daemon
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve searches of the file index over a Unix socket.")
+    parser.add_argument("--socket", default=SOCKET_PATH, help=f"socket path (default: {SOCKET_PATH})")
+    parser.add_argument("--db", action="append",
+                        help="shard database to search, repeatable (default: the roots in config.json)")
+    parser.add_argument("--in-memory", action="store_true", help="copy the index into memory")
+    args = parser.parse_args()
+    db_files = [os.path.abspath(db_file) for db_file in args.db] if args.db else library.shard_files(library.load_roots())
+    serve(os.path.abspath(args.socket), db_files, args.in_memory)
+
+if __name__ == "__main__":
+    main()
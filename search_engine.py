@@ -0,0 +1,442 @@
+import os
+import sqlite3
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from rapidfuzz import fuzz, process
+from rapidfuzz.distance import OSA
+from library import (
+    normalize_text, name_tokens, deletion_variants, TYPO_MIN_LENGTH, TYPO_PREFIX_LENGTH, TYPO_MAX_DISTANCE
+)
+import timing
+
+MIN_SCORE = 50  # Results must score above this average fuzzy match score
+REFINE_MIN_SCORE = 30  # Names scoring above this stay candidates for refined queries
+CACHE_SIZE = 128  # Number of queries whose candidate sets are cached
+TYPO_CANDIDATES = 32  # Most dictionary words, the most frequent, one query word may stand for
+SHORTLIST_SIZE = 20000  # Most files the token index hands to the fuzzy scorer per query
+PATH_BATCH = 500  # File ids looked up per query when putting paths together
+SHARD_BITS = 40  # File ids stay below 2**40, a key holds the shard's position in the bits above
+SHARD_MASK = (1 << SHARD_BITS) - 1
+
+def connect_db(db_file: str) -> sqlite3.Connection:
+    """ Connect to the SQLite database """
+    return sqlite3.connect(db_file)
+
+def fts_phrase(token: str, prefix: bool = False) -> str:
+    """ Quote a token as an FTS5 phrase, optionally matching it as a word prefix """
+    return '"' + token.replace('"', '""') + '"' + ("*" if prefix else "")
+
+def typo_distance(word: str) -> int:
+    """ Number of edits a query word may be away from the dictionary words it stands for """
+    if len(word) < TYPO_MIN_LENGTH or word.isdigit():
+        return 0
+    return 1 if len(word) < 6 else TYPO_MAX_DISTANCE
+
+def typo_candidates(word: str, db_conn: sqlite3.Connection) -> List[str]:
+    """ Return the dictionary words whose start is within the typo distance of the query word,
+    looked up through the deletion variants indexer.py stores for every word, closest first.
+    A word that is itself in the dictionary, or starts one, stands for nothing else. """
+    distance = typo_distance(word)
+    if not distance:
+        return []
+    upper = word[:-1] + chr(ord(word[-1]) + 1)
+    if db_conn.execute(
+        "SELECT 1 FROM name_tokens WHERE token >= ? AND token < ? LIMIT 1", (word, upper)
+    ).fetchone():
+        return []
+    prefix = word[:TYPO_PREFIX_LENGTH]
+    variants = sorted(deletion_variants(prefix))
+    rows = db_conn.execute(
+        "SELECT DISTINCT d.token, t.files FROM token_deletes d JOIN name_tokens t ON t.token = d.token"
+        f" WHERE d.variant IN ({','.join('?' * len(variants))})",
+        variants
+    ).fetchall()
+    # Sharing a variant only bounds the distance, check the actual one. A letter dropped or
+    # added shifts the rest of the word, so compare with the token's starts of every length
+    # the distance allows, not just the prefix's own length.
+    close = []
+    for token, files in rows:
+        edits = min(
+            OSA.distance(prefix, token[:length])
+            for length in range(max(1, len(prefix) - distance), len(prefix) + distance + 1)
+        )
+        if edits <= distance:
+            close.append((edits, -files, token))
+    return [token for _, _, token in sorted(close)[:TYPO_CANDIDATES]]
+
+def typo_match(tokens: List[str], db_conn: sqlite3.Connection) -> Optional[str]:
+    """ Build an FTS5 trigram query for the names containing, for every word of three or more
+    characters in the query tokens, either the word itself or a dictionary word it may be a
+    typo of. A token of three or more characters without such a word ("op.27") is matched as
+    typed. Returns None when nothing is long enough to look up. """
+    groups = []
+    for token in tokens:
+        words = [word for word in name_tokens(token) if len(word) >= 3]
+        if not words:
+            if len(token) >= 3:
+                groups.append(fts_phrase(token))
+            continue  # Else too short for a trigram lookup
+        for word in words:
+            alternatives = {word}
+            try:
+                alternatives.update(candidate for candidate in typo_candidates(word, db_conn) if len(candidate) >= 3)
+            except sqlite3.OperationalError:
+                pass  # The index predates the token dictionary, match the word as typed
+            groups.append("(" + " OR ".join(fts_phrase(alternative) for alternative in sorted(alternatives)) + ")")
+    return " AND ".join(groups) or None
+
+def candidate_rows(tokens: List[str], db_conn: sqlite3.Connection, limit: int = SHORTLIST_SIZE) -> Optional[List[int]]:
+    """ Return the ids of the files worth scoring for the query tokens, or None if the index
+    cannot narrow them down to at most limit files and every name has to be scored. """
+    match = typo_match(tokens, db_conn)
+    if match is None:
+        return None
+    rows = db_conn.execute(
+        "SELECT rowid FROM files_fts WHERE files_fts MATCH ? LIMIT ?", (match, limit + 1)
+    ).fetchall()
+    if len(rows) > limit:
+        return None  # Cutting the shortlist short could drop the best matches
+    return [row[0] for row in rows]
+
+def file_paths(db_conn: sqlite3.Connection, ids: List[int]) -> Dict[int, str]:
+    """ Return the paths of the files with the given ids, put back together from their
+    directory and name. Files that left the index are missing from the result. """
+    paths = {}
+    for start in range(0, len(ids), PATH_BATCH):
+        batch = ids[start:start + PATH_BATCH]
+        cursor = db_conn.execute(
+            "SELECT f.id, d.path, f.name FROM files f JOIN directories d ON d.id = f.dir_id"
+            f" WHERE f.id IN ({','.join('?' * len(batch))})", batch
+        )
+        paths.update((file_id, os.path.join(directory, name)) for file_id, directory, name in cursor)
+    return paths
+
+@timing.timed("search_content")
+def search_content(tokens: List[str], db_conn: sqlite3.Connection, limit: int = 20) -> List[str]:
+    """ Search the title, author and opening text extracted from the PDFs by indexer.py --content. """
+    if not tokens:
+        return []
+    cursor = db_conn.cursor()
+    cursor.execute(
+        "SELECT d.path, f.name FROM pdf_content_fts"
+        " JOIN files f ON f.id = pdf_content_fts.rowid JOIN directories d ON d.id = f.dir_id"
+        " WHERE pdf_content_fts MATCH ? LIMIT ?",
+        (" AND ".join(fts_phrase(token, prefix=True) for token in tokens), limit)
+    )
+    return [os.path.join(directory, name) for directory, name in cursor.fetchall()]
+
+@timing.timed("search_pdfs")
+def search_pdfs(query: str, db_conn: sqlite3.Connection, limit: int = 20) -> List[str]:
+    """ Search for PDFs through the trigram index over the accent-folded names built by indexer.py,
+    followed by PDFs whose extracted content matches. Query words may be typos of the indexed
+    words, see typo_match(). """
+    cursor = db_conn.cursor()
+    tokens = normalize_text(query).split()
+    if not tokens:
+        return []
+
+    # Tokens of three or more characters are trigram index probes; shorter ones cannot be
+    # looked up in a trigram index and filter the probed rows by substring instead
+    long_tokens = [token for token in tokens if len(token) >= 3]
+    short_tokens = [token for token in tokens if len(token) < 3]
+
+    match = typo_match(long_tokens, db_conn) if long_tokens else None
+    if match is not None:
+        sql_query = (
+            "SELECT d.path, f.name FROM files_fts JOIN files f ON f.id = files_fts.rowid"
+            " JOIN directories d ON d.id = f.dir_id WHERE files_fts MATCH ?"
+        )
+        sql_params = [match]
+    else:
+        sql_query = "SELECT d.path, f.name FROM files f JOIN directories d ON d.id = f.dir_id WHERE 1"
+        sql_params = []
+    for token in short_tokens:
+        sql_query += " AND f.norm_name LIKE ? ESCAPE '\\'"
+        sql_params.append("%" + token.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+
+    cursor.execute(f"{sql_query} LIMIT ?", (*sql_params, limit))
+    pdfs = [os.path.join(directory, name) for directory, name in cursor.fetchall()]
+
+    if len(pdfs) < limit:
+        pdfs += [pdf for pdf in search_content(tokens, db_conn, limit) if pdf not in pdfs]
+    return pdfs[:limit]
+
+@timing.timed("fuzzy_token_match")
+def fuzzy_token_match(query_tokens: List[str], filename: str) -> int:
+    """ Perform fuzzy matching on each token with normalized filenames. """
+    filename_lower = normalize_text(filename)
+    total_score = 0
+    for token in query_tokens:
+        token_score = fuzz.partial_ratio(token, filename_lower)
+        total_score += token_score
+    return int(total_score // len(query_tokens))  # Average score
+
+def rank_pdfs(query: str, db_conns: List[sqlite3.Connection], limit: int = 20) -> List[Tuple[str, int]]:
+    """ Return the (path, score) of the best matches for the query, best first: the PDFs
+    search_pdfs() finds in every shard, scored with fuzzy_token_match(). Needs no catalogue
+    in memory, unlike SearchEngine.search(). """
+    query_tokens = normalize_text(query).split()
+    if not query_tokens:
+        return []
+    matches = []
+    for db_conn in db_conns:
+        for pdf in search_pdfs(query, db_conn, limit):
+            score = fuzzy_token_match(query_tokens, os.path.basename(pdf))
+            if score > MIN_SCORE:
+                matches.append((pdf, score))
+    matches.sort(key=lambda match: match[1], reverse=True)
+    return matches[:limit]
+
+
+class Shard:
+    """ One index database of the catalogue, written by indexer.py for one root of the library.
+
+    file_conn watches the database for changes and db_conn answers queries. They are the
+    same connection unless in_memory is set, in which case db_conn is a copy of the database
+    made with SQLite's backup API on every (re)load, so content searches never wait on the disk.
+    """
+
+    def __init__(self, db_file: str, in_memory: bool = False) -> None:
+        self.db_file = db_file
+        self.in_memory = in_memory
+        self.has_token_index = False
+        self.ids = np.empty(0, dtype=np.int64)  # File ids of the names, ascending
+        self.names: List[str] = []
+        self.signature = None
+        self.file_conn: Optional[sqlite3.Connection] = None
+        self.db_conn: Optional[sqlite3.Connection] = None
+
+    def index_signature(self) -> tuple:
+        """ Identify the current state of the index: the file, and SQLite's count of commits
+        made to it by other connections, which covers writes still in the write-ahead log """
+        try:
+            inode = os.stat(self.db_file).st_ino
+        except OSError:
+            inode = None
+        return inode, self.file_conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def changed(self) -> bool:
+        """ Whether indexer.py has written to the database since it was loaded """
+        return self.index_signature() != self.signature
+
+    def load(self) -> None:
+        """ (Re)load the ids and normalized names of every file in the shard """
+        if self.db_conn is not None and self.db_conn is not self.file_conn:
+            self.db_conn.close()
+        if self.file_conn is not None:
+            self.file_conn.close()
+        # Kept open for content searches, which run on the search worker thread
+        self.file_conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self.signature = self.index_signature()
+        if self.in_memory:
+            self.db_conn = sqlite3.connect(":memory:", check_same_thread=False)
+            self.file_conn.backup(self.db_conn)
+        else:
+            self.db_conn = self.file_conn
+        try:
+            rows = self.db_conn.execute("SELECT id, norm_name FROM files ORDER BY id").fetchall()
+        except sqlite3.OperationalError as e:
+            print(f"Could not load the index from {self.db_file}: {e}")
+            rows = []
+        # Indexes written before the token dictionary existed are scored in full, as they were
+        self.has_token_index = self.db_conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'token_deletes'"
+        ).fetchone() is not None
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.names = [row[1] for row in rows]
+
+
+class SearchEngine:
+    """ Fuzzy search over the whole catalogue, held in memory.
+
+    The catalogue is merged from the shard databases indexer.py writes, one per root of the
+    library. Every normalized file name is loaded once, under a key made of the shard's
+    position and the file id, and paths are looked up in the shards only for the matches a
+    search returns. A query with a word of three or more characters first asks the token
+    index of every shard for the files containing that word, or a dictionary word it may be
+    a typo of, and only that shortlist is scored. Other queries score every name, as do
+    queries whose shortlist is empty or longer than SHORTLIST_SIZE. Scoring uses rapidfuzz's
+    batched cdist across worker threads, with the same token-averaged partial ratios as
+    fuzzy_token_match().
+
+    PDFs whose extracted title, author or opening text match the query are appended after
+    the name matches, so badly named scans are still found.
+
+    Candidate sets are kept in an LRU cache keyed on the normalized tokens, so going back to
+    a query (backspacing) scores nothing. A query whose tokens each contain the matching
+    token of a cached query scored over every name (typing "beetho" after "beeth") only
+    rescores that query's candidates. This is a heuristic, not an exact filter: partial_ratio
+    aligns a token with the edges of a name too, so a name that scored REFINE_MIN_SCORE or
+    less on the shorter query can, rarely, pass MIN_SCORE on the longer one ("cs" matches a
+    name ending in "s" that "c" did not) and is then missing from the refined results. A shard is reloaded, and
+    the cache dropped, whenever its database is written to or replaced.
+
+    With in_memory set, every shard is copied into an in-memory database, see Shard.
+    """
+
+    def __init__(self, db_files: List[str], workers: int = -1, in_memory: bool = False) -> None:
+        self.workers = workers  # -1 uses every core
+        self.shards = [Shard(db_file, in_memory) for db_file in db_files]
+        self.ids = np.empty(0, dtype=np.int64)  # Keys of the names (see key()), ascending
+        self.names: List[str] = []
+        # Candidates and scores per query, and whether a longer query may refine them
+        self.cache: "OrderedDict[Tuple[str, ...], Tuple[np.ndarray, np.ndarray, bool]]" = OrderedDict()
+        self.load()
+
+    @staticmethod
+    def key(position: int, file_id) -> int:
+        """ Key of a file in the merged catalogue: its shard's position above SHARD_BITS """
+        return (position << SHARD_BITS) | file_id
+
+    def load(self, shards: Optional[List[Shard]] = None) -> None:
+        """ (Re)load the given shards, or all of them, and merge their names into the catalogue """
+        for shard in self.shards if shards is None else shards:
+            shard.load()
+        self.ids = np.concatenate(
+            [self.key(position, shard.ids) for position, shard in enumerate(self.shards)]
+        ) if self.shards else np.empty(0, dtype=np.int64)
+        self.names = [name for shard in self.shards for name in shard.names]
+        self.cache.clear()
+
+    def reload_if_changed(self) -> None:
+        """ Reload the shards indexer.py has written to since they were loaded """
+        changed = [shard for shard in self.shards if shard.changed()]
+        if changed:
+            self.load(changed)
+
+    def warm_up(self) -> None:
+        """ Score a throwaway query, so the first real one does not pay for rapidfuzz's start-up """
+        if self.names:
+            process.cdist(["warm"], self.names[:1], scorer=fuzz.partial_ratio, workers=self.workers)
+
+    @timing.timed("SearchEngine.shortlist")
+    def shortlist(self, tokens: List[str]) -> Optional[List[int]]:
+        """ Return the keys of the files worth scoring for the query tokens, from the token
+        index of every shard, or None if every name has to be scored """
+        keys = []
+        for position, shard in enumerate(self.shards):
+            if not shard.names:
+                continue  # Not indexed yet, like the shard of a root that was never online
+            rows = candidate_rows(tokens, shard.db_conn) if shard.has_token_index else None
+            if rows is None:
+                return None
+            keys += [self.key(position, file_id) for file_id in rows]
+        return keys
+
+    @timing.timed("SearchEngine.file_paths")
+    def file_paths(self, keys: List[int]) -> Dict[int, str]:
+        """ Return the paths of the files with the given keys, looked up in their shards """
+        by_shard: Dict[int, List[int]] = {}
+        for key in keys:
+            by_shard.setdefault(key >> SHARD_BITS, []).append(key & SHARD_MASK)
+        paths = {}
+        for position, ids in by_shard.items():
+            shard_paths = file_paths(self.shards[position].db_conn, ids)
+            paths.update((self.key(position, file_id), path) for file_id, path in shard_paths.items())
+        return paths
+
+    @timing.timed("SearchEngine.search")
+    def search(self, query: str, limit: int = 20) -> List[Tuple[str, int]]:
+        """ Return the (path, score) of the best matches for the query, best first """
+        query_tokens = tuple(normalize_text(query).split())
+        if not query_tokens:
+            return []
+        self.reload_if_changed()
+        if not self.names:
+            return []
+
+        candidates, totals = self.score(query_tokens)
+
+        # Select the global top matches without sorting the whole candidate set
+        selected = np.flatnonzero(totals > MIN_SCORE)
+        if len(selected) > limit:
+            selected = selected[np.argpartition(-totals[selected], limit - 1)[:limit]]
+        ranked = selected[np.argsort(-totals[selected], kind="stable")]
+        keys = [int(self.ids[candidates[i]]) for i in ranked]
+        paths = self.file_paths(keys)
+        matches = [(paths[key], int(totals[i])) for key, i in zip(keys, ranked) if key in paths]
+
+        if len(matches) < limit and any(len(token) >= 3 for token in query_tokens):
+            found = {pdf for pdf, _ in matches}
+            for shard in self.shards:
+                try:
+                    content = search_content(list(query_tokens), shard.db_conn, limit)
+                except sqlite3.OperationalError:
+                    content = []  # The index predates content extraction
+                matches += [(pdf, MIN_SCORE) for pdf in content if pdf not in found]
+                if len(matches) >= limit:
+                    break
+        return matches[:limit]
+
+    def score(self, query_tokens: Tuple[str, ...]) -> Tuple[np.ndarray, np.ndarray]:
+        """ Return the indices of the candidate names for the tokens and their scores """
+        cached = self.cache.get(query_tokens)
+        if cached is not None:
+            self.cache.move_to_end(query_tokens)
+            return cached[:2]
+
+        # Score the shortlist from the token index if it has one. It may lack names that
+        # score above zero without containing the words, so it is cached for this exact
+        # query only, never as the base of a refinement.
+        shortlist = self.shortlist(list(query_tokens))
+        if shortlist:
+            candidates, totals = self.score_shortlist(query_tokens, shortlist)
+            keep = np.flatnonzero(totals > REFINE_MIN_SCORE)
+            return self.remember(query_tokens, candidates[keep], totals[keep], refinable=False)
+
+        # Rescore only the candidates of a cached query this one refines, else everything.
+        # An empty shortlist falls through to here too, so that a word too mistyped for
+        # the token index ("chpin", "bch") is still scored against every name.
+        base = self.refinement_base(query_tokens)
+        if base is None:
+            names = self.names
+        else:
+            names = [self.names[i] for i in base]
+
+        totals = self.fuzzy_scores(query_tokens, names)
+
+        # Keep more than the displayed matches so that longer queries can refine this one,
+        # see the class docstring for what refining can miss
+        keep = np.flatnonzero(totals > REFINE_MIN_SCORE)
+        candidates = keep if base is None else base[keep]
+        return self.remember(query_tokens, candidates, totals[keep], refinable=True)
+
+    def remember(self, query_tokens: Tuple[str, ...], candidates: np.ndarray, totals: np.ndarray,
+                 refinable: bool) -> Tuple[np.ndarray, np.ndarray]:
+        """ Cache the candidates of a query and their scores, evicting the least recently used """
+        self.cache[query_tokens] = (candidates, totals, refinable)
+        if len(self.cache) > CACHE_SIZE:
+            self.cache.popitem(last=False)
+        return candidates, totals
+
+    def score_shortlist(self, query_tokens: Tuple[str, ...], ids: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """ Return the indices of the names with the given keys and their scores """
+        ids = np.array(ids, dtype=np.int64)
+        candidates = np.searchsorted(self.ids, ids)
+        # Files indexed since the catalogue was loaded are not in it yet
+        known = candidates < len(self.ids)
+        known[known] = self.ids[candidates[known]] == ids[known]
+        candidates = candidates[known]
+        if not len(candidates):
+            return candidates, np.empty(0, dtype=np.int64)
+
+        return candidates, self.fuzzy_scores(query_tokens, [self.names[i] for i in candidates])
+
+    @timing.timed("SearchEngine.fuzzy_scores")
+    def fuzzy_scores(self, query_tokens: Tuple[str, ...], names: List[str]) -> np.ndarray:
+        """ Score the names for the tokens: one row of partial ratios per token, averaged
+        into one score per name """
+        scores = process.cdist(query_tokens, names, scorer=fuzz.partial_ratio, workers=self.workers)
+        return scores.sum(axis=0) // len(query_tokens)
+
+    def refinement_base(self, query_tokens: Tuple[str, ...]) -> Optional[np.ndarray]:
+        """ Return the smallest cached candidate set of a query that this one narrows """
+        base = None
+        for cached_tokens, (candidates, _, refinable) in self.cache.items():
+            if not refinable or len(cached_tokens) != len(query_tokens):
+                continue
+            if all(old in new for old, new in zip(cached_tokens, query_tokens)):
+                if base is None or len(candidates) < len(base):
+                    base = candidates
+        return base
@@ -0,0 +1,97 @@
+import os
+import hashlib
+import subprocess
+import tempfile
+import threading
+from typing import Optional, Tuple
+import library
+
+# First-page previews are rendered once with pdftoppm and kept in an on-disk cache. A
+# thumbnail is keyed on the PDF's path, size and mtime, so a changed scan gets a new one and
+# the stale one ages out. The mtime of a cached file records when it was last used, and the
+# least recently used thumbnails are evicted once the cache outgrows its byte budget.
+CACHE_DIR = os.path.expanduser("~/.cache/search-scores/thumbnails")
+CACHE_BUDGET = 200 * 1024 * 1024  # Bytes
+RENDER_SIZE = 96  # Pixels along the longer side of a rendered thumbnail
+RENDER_TIMEOUT = 30  # Seconds allowed per pdftoppm run
+EVICT_EVERY = 50  # Renders between two checks of the cache size
+
+_renders_since_evict = 0
+_evict_lock = threading.Lock()
+
+def thumbnail_file(pdf_path: str, size: int, mtime: int) -> str:
+    """ Path of the cached thumbnail for a PDF with the given size and mtime """
+    key = hashlib.sha1(f"{pdf_path}\0{size}\0{mtime}".encode("utf-8", "surrogateescape"))
+    digest = key.hexdigest()
+    return os.path.join(CACHE_DIR, digest[:2], digest + ".png")
+
+def cached_thumbnail(pdf_path: str, size: int, mtime: int) -> Optional[str]:
+    """ Return the cached thumbnail of a PDF and mark it as recently used, or None """
+    path = thumbnail_file(pdf_path, size, mtime)
+    try:
+        os.utime(path)
+    except OSError:
+        return None
+    return path
+
+def render_thumbnail(pdf_path: str, size: int, mtime: int) -> Optional[str]:
+    """ Render the first page of a PDF into the cache and return its path, or None on failure """
+    path = thumbnail_file(pdf_path, size, mtime)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Render next to the final file and move it into place, so readers never see a partial PNG
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(path)) as tmp_dir:
+        prefix = os.path.join(tmp_dir, "page")
+        try:
+            result = subprocess.run(
+                ["pdftoppm", "-png", "-f", "1", "-l", "1", "-singlefile",
+                 "-scale-to", str(RENDER_SIZE), pdf_path, prefix],
+                capture_output=True, timeout=RENDER_TIMEOUT
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        if result.returncode != 0 or not os.path.exists(prefix + ".png"):
+            return None
+        os.replace(prefix + ".png", path)
+
+    global _renders_since_evict
+    with _evict_lock:
+        _renders_since_evict += 1
+        if _renders_since_evict >= EVICT_EVERY:
+            _renders_since_evict = 0
+            evict_thumbnails()
+    return path
+
+def get_thumbnail(pdf_path: str, identity: Optional[Tuple[int, int]] = None) -> Optional[str]:
+    """ Return the thumbnail of a PDF from the cache, rendering it first if needed """
+    try:
+        size, mtime = identity or library.file_identity(pdf_path)
+    except OSError:
+        return None
+    return cached_thumbnail(pdf_path, size, mtime) or render_thumbnail(pdf_path, size, mtime)
+
+def evict_thumbnails(budget: int = CACHE_BUDGET) -> int:
+    """ Delete the least recently used thumbnails until the cache fits its budget """
+    entries = []
+    total = 0
+    for root, dirs, files in os.walk(CACHE_DIR):
+        for file in files:
+            path = os.path.join(root, file)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= budget:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
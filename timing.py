@@ -0,0 +1,109 @@
+import json
+import time
+import threading
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Iterator, List, Tuple
+
+# Timing spans for the steps between a keystroke and what the user sees. Each span keeps
+# its most recent durations, from which a histogram and percentiles are computed on demand,
+# so recording a span is a clock read and an append. The stats overlay in app.py shows them,
+# and dump() appends them to a JSON-lines log for comparing runs on the kiosk.
+WINDOW = 1000  # Most recent durations kept per span
+BUCKETS_MS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000]  # Histogram bucket upper bounds
+
+_durations: Dict[str, deque] = {}
+_lock = threading.Lock()
+_collecting = threading.local()  # Durations being collected on each thread, see collect()
+
+def record(name: str, seconds: float) -> None:
+    """ Add one duration to a span's rolling window """
+    window = _durations.get(name)
+    if window is None:
+        with _lock:
+            window = _durations.setdefault(name, deque(maxlen=WINDOW))
+    window.append(seconds)
+    collected = getattr(_collecting, "spans", None)
+    if collected is not None:
+        collected.append((name, seconds))
+
+@contextmanager
+def collect() -> Iterator[List[Tuple[str, float]]]:
+    """ Collect the (span, seconds) durations recorded on this thread within the block as well,
+    for the search daemon to send back with each reply """
+    previous = getattr(_collecting, "spans", None)
+    _collecting.spans = spans = []
+    try:
+        yield spans
+    finally:
+        _collecting.spans = previous
+
+def timed(name: str) -> Callable:
+    """ Decorate a function so every call records its duration under the span name """
+    def decorate(function: Callable) -> Callable:
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+def histogram(durations: List[float]) -> List[int]:
+    """ Count durations per bucket of BUCKETS_MS, plus one bucket for anything slower """
+    counts = [0] * (len(BUCKETS_MS) + 1)
+    for seconds in durations:
+        counts[bisect_left(BUCKETS_MS, seconds * 1000)] += 1
+    return counts
+
+def percentiles(durations: List[float]) -> Dict[str, float]:
+    """ Return the count, median, tail percentiles and maximum of durations, in milliseconds """
+    ordered = sorted(durations)
+    def at(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 3)
+    return {
+        "count": len(ordered),
+        "p50_ms": at(0.50),
+        "p95_ms": at(0.95),
+        "p99_ms": at(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+def summary() -> Dict[str, dict]:
+    """ Return the count, percentiles and histogram of every span's rolling window """
+    with _lock:
+        windows = {name: list(window) for name, window in _durations.items()}
+
+    stats = {}
+    for name, durations in sorted(windows.items()):
+        if durations:
+            stats[name] = dict(percentiles(durations), histogram=histogram(durations))
+    return stats
+
+def dump(log_file: str) -> None:
+    """ Append the current summary of every span to a JSON-lines log """
+    line = {"time": datetime.now().isoformat(timespec="seconds"), "spans": summary()}
+    try:
+        with open(log_file, "a") as f:
+            f.write(json.dumps(line) + "\n")
+    except OSError as e:
+        print(f"Could not write timings to {log_file}: {e}")
+
+def format_summary() -> str:
+    """ Render the summary as fixed-width text lines, each with a bar per histogram bucket """
+    bars = " ▁▂▃▄▅▆▇█"
+    lines = [f"{'span':<26}{'n':>6}{'p50':>9}{'p95':>9}{'p99':>9}  histogram (ms)"]
+    for name, stats in summary().items():
+        peak = max(stats["histogram"])
+        shape = "".join(bars[(count * (len(bars) - 1) + peak - 1) // peak] for count in stats["histogram"])
+        lines.append(
+            f"{name:<26}{stats['count']:>6}{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}"
+            f"{stats['p99_ms']:>9.2f}  {shape}"
+        )
+    lines.append(f"{'':<59}≤{BUCKETS_MS[0]:g} … >{BUCKETS_MS[-1]:g}")
+    return "\n".join(lines)